@@ -0,0 +1,29 @@
+import argparse
+import time
+
+from utils.auth_settings import hash_password, hashing_config
+
+PASSWORD = "BenchmarkPassword"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="bcrypt hash time per cost level")
+    parser.add_argument("--min-rounds", type=int, default=8)
+    parser.add_argument("--max-rounds", type=int, default=14)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"configured rounds: {hashing_config.ROUNDS}, workers: {hashing_config.WORKERS}")
+    for rounds in range(args.min_rounds, args.max_rounds + 1):
+        timings = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            hash_password(PASSWORD, rounds=rounds)
+            timings.append(time.perf_counter() - start)
+
+        best = min(timings)
+        print(f"rounds={rounds:<3} {best * 1000:>9.1f} ms/hash  {hashing_config.WORKERS / best:>8.1f} logins/s")
+
+
+if __name__ == "__main__":
+    main()
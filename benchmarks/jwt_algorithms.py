@@ -0,0 +1,35 @@
+import time
+
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
+
+from utils.auth_settings import encode_jwt, decode_jwt
+
+ITERATIONS = 1000
+KEYS = {
+    "RS256": rsa.generate_private_key(public_exponent=65537, key_size=2048),
+    "ES256": ec.generate_private_key(ec.SECP256R1()),
+    "EdDSA": ed25519.Ed25519PrivateKey.generate(),
+}
+
+
+def main() -> None:
+    for algorithm, private_key in KEYS.items():
+        public_key = private_key.public_key()
+
+        start = time.perf_counter()
+        tokens = [
+            encode_jwt(payload={"sub": f"user_{i}"}, private_key=private_key, algorithm=algorithm)
+            for i in range(ITERATIONS)
+        ]
+        sign = (time.perf_counter() - start) / ITERATIONS
+
+        start = time.perf_counter()
+        for token in tokens:
+            decode_jwt(token=token, public_key=public_key, algorithm=algorithm)
+        verify = (time.perf_counter() - start) / ITERATIONS
+
+        print(f"{algorithm:<6} sign {sign * 1e6:>8.1f} us/op  verify {verify * 1e6:>8.1f} us/op")
+
+
+if __name__ == "__main__":
+    main()
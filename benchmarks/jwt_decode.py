@@ -0,0 +1,26 @@
+import time
+
+from utils.auth_settings import encode_jwt, decode_jwt, verified_tokens_cache
+
+ITERATIONS = 2000
+
+
+def bench(label: str, tokens: list[str]) -> None:
+    start = time.perf_counter()
+    for token in tokens:
+        decode_jwt(token=token)
+    elapsed = time.perf_counter() - start
+
+    print(f"{label:<6} {len(tokens) / elapsed:>12.0f} verifications/s  {elapsed / len(tokens) * 1e6:>8.1f} us/op")
+
+
+def main() -> None:
+    tokens = [encode_jwt(payload={"sub": f"user_{i}", "type": "access"}) for i in range(ITERATIONS)]
+
+    verified_tokens_cache.clear()
+    bench("cold", tokens)
+    bench("warm", tokens)
+
+
+if __name__ == "__main__":
+    main()
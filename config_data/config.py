@@ -1,5 +1,6 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from pathlib import Path
+from typing import Dict, List, Optional
 from environs import Env
 
 BASE_DIR = Path(__file__).parent.parent
@@ -12,19 +13,63 @@ class DataBase:
     DB_USER: str
     DB_PASS: str
     DB_NAME: str
+    POOL_SIZE: int = 5
+    MAX_OVERFLOW: int = 10
+    POOL_TIMEOUT: float = 30
+    # Seconds after which a connection is replaced, -1 to keep connections forever
+    POOL_RECYCLE: int = -1
+    # Test connections on checkout, so connections broken by a failover are replaced transparently
+    POOL_PRE_PING: bool = False
+    STATEMENT_CACHE_SIZE: int = 100
+    APPLICATION_NAME: str = "todo-api"
+    # Milliseconds, 0 disables the timeout
+    STATEMENT_TIMEOUT: int = 0
+    SERVER_SETTINGS: Dict[str, str] = field(default_factory=dict)
+    # "none" or "transaction", the latter for PgBouncer and other poolers in transaction mode
+    POOLER_MODE: str = "none"
+    # Read-only replica with the same credentials, reads only go there when the host is set
+    REPLICA_HOST: str = ""
+    REPLICA_PORT: int = 0
 
     @property
     def DATABASE_URL(self):
         return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.DB_HOST}:{self.DB_PORT}/{self.DB_NAME}"
 
+    @property
+    def REPLICA_DATABASE_URL(self) -> Optional[str]:
+        if not self.REPLICA_HOST:
+            return None
+        port = self.REPLICA_PORT or self.DB_PORT
+        return f"postgresql+asyncpg://{self.DB_USER}:{self.DB_PASS}@{self.REPLICA_HOST}:{port}/{self.DB_NAME}"
+
+    @property
+    def server_settings(self) -> Dict[str, str]:
+        server_settings = {"application_name": self.APPLICATION_NAME}
+        if self.STATEMENT_TIMEOUT:
+            server_settings["statement_timeout"] = str(self.STATEMENT_TIMEOUT)
+        return {**server_settings, **self.SERVER_SETTINGS}
+
 
 @dataclass
 class AuthJWT:
     private_key_path: Path = BASE_DIR / "certs" / "jwt-private.pem"
     public_key_path: Path = BASE_DIR / "certs" / "jwt-public.pem"
+    # Public keys of the previous signing keys, accepted until their tokens expire
+    previous_public_key_paths: List[Path] = field(default_factory=list)
+    # RS256, ES256 or EdDSA (Ed25519), must match the private key type
     algorithm: str = "RS256"
     access_token_expire_minutes: int = 120
     refresh_token_expire_days: int = 30
+    verified_tokens_cache_size: int = 10000
+    revocation_refresh_seconds: int = 30
+    revocation_error_rate: float = 0.001
+
+
+@dataclass
+class PasswordHashing:
+    ROUNDS: int = 12
+    WORKERS: int = 4
+    QUEUE_LIMIT: int = 32
 
 
 @dataclass
@@ -33,6 +78,23 @@ class EmailSender:
     EMAIL_PASS: str
     MIN_CODE: int
     MAX_CODE: int
+    SMTP_HOST: str = "smtp.gmail.com"
+    SMTP_PORT: int = 587
+    SMTP_STARTTLS: bool = True
+    WORKERS: int = 2
+    QUEUE_SIZE: int = 1000
+    MAX_RETRIES: int = 3
+    RETRY_BACKOFF: float = 1.0
+
+
+@dataclass
+class VerifyCodes:
+    # "memory" or "database"
+    STORE: str = "memory"
+    TTL: int = 600
+    MAX_ATTEMPTS: int = 5
+    SWEEP_INTERVAL: int = 60
+    MAX_SIZE: int = 100000
 
 
 @dataclass
@@ -40,14 +102,37 @@ class VariablesData:
     MODE: str
     MIN_ID: int
     MAX_ID: int
+    # Key of the permutation that turns sequence numbers into public ids, changing it reshuffles new ids
+    ID_KEY: int = 0
+    ID_BLOCK_SIZE: int = 32
+
+
+@dataclass
+class Cache:
+    USER_CACHE_SIZE: int = 10000
+    USER_CACHE_TTL: int = 60
+    # Changes made through other processes show up in ETags after at most this many seconds
+    DATA_VERSION_CACHE_TTL: int = 5
+    # Task statistics are cached per data version, writes don't have to wait for the TTL
+    TASK_STATS_CACHE_TTL: int = 300
+
+
+@dataclass
+class Pagination:
+    DEFAULT_PAGE_SIZE: int = 50
+    MAX_PAGE_SIZE: int = 200
 
 
 @dataclass
 class Config:
     database: DataBase
     authJWT: AuthJWT
+    password_hashing: PasswordHashing
     email_sender: EmailSender
+    verify_codes: VerifyCodes
     variablesData: VariablesData
+    cache: Cache
+    pagination: Pagination
 
 
 def load_config(path: str | None = None) -> Config:
@@ -60,22 +145,66 @@ def load_config(path: str | None = None) -> Config:
             DB_PORT=env("DB_PORT"),
             DB_USER=env("DB_USER"),
             DB_PASS=env("DB_PASS"),
-            DB_NAME=env("DB_NAME")
+            DB_NAME=env("DB_NAME"),
+            POOL_SIZE=int(env("DB_POOL_SIZE", DataBase.POOL_SIZE)),
+            MAX_OVERFLOW=int(env("DB_MAX_OVERFLOW", DataBase.MAX_OVERFLOW)),
+            POOL_TIMEOUT=float(env("DB_POOL_TIMEOUT", DataBase.POOL_TIMEOUT)),
+            POOL_RECYCLE=int(env("DB_POOL_RECYCLE", DataBase.POOL_RECYCLE)),
+            POOL_PRE_PING=env.bool("DB_POOL_PRE_PING", DataBase.POOL_PRE_PING),
+            STATEMENT_CACHE_SIZE=int(env("DB_STATEMENT_CACHE_SIZE", DataBase.STATEMENT_CACHE_SIZE)),
+            APPLICATION_NAME=env("DB_APPLICATION_NAME", DataBase.APPLICATION_NAME),
+            STATEMENT_TIMEOUT=int(env("DB_STATEMENT_TIMEOUT", DataBase.STATEMENT_TIMEOUT)),
+            SERVER_SETTINGS=env.dict("DB_SERVER_SETTINGS", {}),
+            POOLER_MODE=env("DB_POOLER_MODE", DataBase.POOLER_MODE),
+            REPLICA_HOST=env("DB_REPLICA_HOST", DataBase.REPLICA_HOST),
+            REPLICA_PORT=int(env("DB_REPLICA_PORT", DataBase.REPLICA_PORT))
         ),
         authJWT=AuthJWT(
-            private_key_path=AuthJWT.private_key_path,
-            public_key_path=AuthJWT.public_key_path,
-            algorithm=AuthJWT.algorithm
+            private_key_path=Path(env("JWT_PRIVATE_KEY_PATH", AuthJWT.private_key_path)),
+            public_key_path=Path(env("JWT_PUBLIC_KEY_PATH", AuthJWT.public_key_path)),
+            previous_public_key_paths=[Path(path) for path in env.list("JWT_PREVIOUS_PUBLIC_KEY_PATHS", [])],
+            algorithm=env("JWT_ALGORITHM", AuthJWT.algorithm)
+        ),
+        password_hashing=PasswordHashing(
+            ROUNDS=int(env("PASSWORD_HASHING_ROUNDS", PasswordHashing.ROUNDS)),
+            WORKERS=int(env("PASSWORD_HASHING_WORKERS", PasswordHashing.WORKERS)),
+            QUEUE_LIMIT=int(env("PASSWORD_HASHING_QUEUE_LIMIT", PasswordHashing.QUEUE_LIMIT))
         ),
         email_sender=EmailSender(
             EMAIL_NAME=env("EMAIL_NAME"),
             EMAIL_PASS=env("EMAIL_PASS"),
             MIN_CODE=int(env("MIN_CODE")),
-            MAX_CODE=int(env("MAX_CODE"))
+            MAX_CODE=int(env("MAX_CODE")),
+            SMTP_HOST=env("SMTP_HOST", EmailSender.SMTP_HOST),
+            SMTP_PORT=int(env("SMTP_PORT", EmailSender.SMTP_PORT)),
+            SMTP_STARTTLS=env.bool("SMTP_STARTTLS", EmailSender.SMTP_STARTTLS),
+            WORKERS=int(env("EMAIL_WORKERS", EmailSender.WORKERS)),
+            QUEUE_SIZE=int(env("EMAIL_QUEUE_SIZE", EmailSender.QUEUE_SIZE)),
+            MAX_RETRIES=int(env("EMAIL_MAX_RETRIES", EmailSender.MAX_RETRIES)),
+            RETRY_BACKOFF=float(env("EMAIL_RETRY_BACKOFF", EmailSender.RETRY_BACKOFF))
+        ),
+        verify_codes=VerifyCodes(
+            STORE=env("VERIFY_CODES_STORE", VerifyCodes.STORE),
+            TTL=int(env("VERIFY_CODES_TTL", VerifyCodes.TTL)),
+            MAX_ATTEMPTS=int(env("VERIFY_CODES_MAX_ATTEMPTS", VerifyCodes.MAX_ATTEMPTS)),
+            SWEEP_INTERVAL=int(env("VERIFY_CODES_SWEEP_INTERVAL", VerifyCodes.SWEEP_INTERVAL)),
+            MAX_SIZE=int(env("VERIFY_CODES_MAX_SIZE", VerifyCodes.MAX_SIZE))
         ),
         variablesData=VariablesData(
             MODE=env("MODE"),
             MIN_ID=int(env("MIN_ID")),
-            MAX_ID=int(env("MAX_ID"))
+            MAX_ID=int(env("MAX_ID")),
+            ID_KEY=int(env("ID_KEY", VariablesData.ID_KEY)),
+            ID_BLOCK_SIZE=int(env("ID_BLOCK_SIZE", VariablesData.ID_BLOCK_SIZE))
+        ),
+        cache=Cache(
+            USER_CACHE_SIZE=int(env("USER_CACHE_SIZE", Cache.USER_CACHE_SIZE)),
+            USER_CACHE_TTL=int(env("USER_CACHE_TTL", Cache.USER_CACHE_TTL)),
+            DATA_VERSION_CACHE_TTL=int(env("DATA_VERSION_CACHE_TTL", Cache.DATA_VERSION_CACHE_TTL)),
+            TASK_STATS_CACHE_TTL=int(env("TASK_STATS_CACHE_TTL", Cache.TASK_STATS_CACHE_TTL))
+        ),
+        pagination=Pagination(
+            DEFAULT_PAGE_SIZE=int(env("DEFAULT_PAGE_SIZE", Pagination.DEFAULT_PAGE_SIZE)),
+            MAX_PAGE_SIZE=int(env("MAX_PAGE_SIZE", Pagination.MAX_PAGE_SIZE))
         )
     )
@@ -1,27 +1,42 @@
+import asyncio
 import os
 import uvicorn
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from contextlib import asynccontextmanager
 
+from src.database import get_async_session
 from src.users.user_routers import router as users_router
 from src.users.admin_routers import router as admin_router
 from src.categories.routers import router as categories_router
 from src.tasks.routers import router as tasks_router
+from src.sync.routers import router as sync_router
+from src.users.revocation import token_revocation_list
+from src.users.verify_codes import verify_code_store, verify_codes_config
+from utils.email_sender import mail_queue
 from fastapi.staticfiles import StaticFiles
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):  # noqa
     os.system("alembic upgrade head")
+    await mail_queue.start()
+    await token_revocation_list.rebuild()
+    revocation_task = asyncio.create_task(token_revocation_list.run_periodic_rebuild())
+    verify_codes_task = asyncio.create_task(verify_code_store.run_periodic_sweep(verify_codes_config.SWEEP_INTERVAL))
 
     yield
 
+    revocation_task.cancel()
+    verify_codes_task.cancel()
+    await mail_queue.stop()
+
 
 app = FastAPI(
     title="ToDo-API",
-    lifespan=lifespan
+    lifespan=lifespan,
+    dependencies=[Depends(get_async_session)]
 )
 
 app.mount("/static", StaticFiles(directory="assets"))
@@ -41,6 +56,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 
@@ -53,6 +69,7 @@ app.include_router(users_router)
 app.include_router(admin_router)
 app.include_router(categories_router)
 app.include_router(tasks_router)
+app.include_router(sync_router)
 
 if __name__ == "__main__":
     uvicorn.run(
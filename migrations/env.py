@@ -8,21 +8,17 @@ from sqlalchemy.engine import Connection
 from sqlalchemy import pool
 from sqlalchemy.ext.asyncio import async_engine_from_config
 
-from src.database import Base
+from src.database import Base, engine_url, migration_connect_args
 
-from src.users.models import User, VerifyCode  # noqa
+from src.users.models import User, VerifyCode, RevokedToken  # noqa
 from src.categories.models import Category  # noqa
 from src.tasks.models import Task  # noqa
+from src.sync.models import Tombstone  # noqa
 
 from alembic import context
 
-from config_data.config import Config, load_config
-
-database_config: Config = load_config(".env")
-DATABASE_URL = database_config.database.DATABASE_URL
-
 config = context.config
-config.set_main_option("sqlalchemy.url", DATABASE_URL)
+config.set_main_option("sqlalchemy.url", engine_url.render_as_string(hide_password=False).replace("%", "%%"))
 
 sys.path.append(os.path.join(sys.path[0], "src"))
 
@@ -57,6 +53,7 @@ async def run_async_migrations() -> None:
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
         poolclass=pool.NullPool,
+        connect_args=migration_connect_args,
     )
 
     async with connectable.connect() as connection:
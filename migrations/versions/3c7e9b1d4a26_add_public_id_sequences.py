@@ -0,0 +1,30 @@
+"""Add public id sequences
+
+Revision ID: 3c7e9b1d4a26
+Revises: 8a3f61c0d2b7
+Create Date: 2026-10-18 13:24:51.208417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c7e9b1d4a26'
+down_revision: Union[str, None] = '8a3f61c0d2b7'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+sequences = ['users_public_id_seq', 'categories_public_id_seq', 'tasks_public_id_seq']
+
+
+def upgrade() -> None:
+    for name in sequences:
+        op.execute(sa.schema.CreateSequence(sa.Sequence(name, start=0, minvalue=0)))
+
+
+def downgrade() -> None:
+    for name in sequences:
+        op.execute(sa.schema.DropSequence(sa.Sequence(name)))
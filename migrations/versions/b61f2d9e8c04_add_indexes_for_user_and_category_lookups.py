@@ -0,0 +1,38 @@
+"""Add indexes for user and category lookups
+
+Revision ID: b61f2d9e8c04
+Revises: 3c7e9b1d4a26
+Create Date: 2026-10-18 14:05:33.917254
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b61f2d9e8c04'
+down_revision: Union[str, None] = '3c7e9b1d4a26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # CONCURRENTLY doesn't lock the tables for writes, but can't run inside a transaction
+    with op.get_context().autocommit_block():
+        op.create_index(op.f('ix_categories_user_id'), 'categories', ['user_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index(op.f('ix_tasks_category_id'), 'tasks', ['category_id'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+        op.create_index('ix_tasks_user_id_date', 'tasks', ['user_id', 'date'], unique=False,
+                        postgresql_concurrently=True, if_not_exists=True)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_tasks_user_id_date', table_name='tasks', postgresql_concurrently=True, if_exists=True)
+        op.drop_index(op.f('ix_tasks_category_id'), table_name='tasks', postgresql_concurrently=True,
+                      if_exists=True)
+        op.drop_index(op.f('ix_categories_user_id'), table_name='categories', postgresql_concurrently=True,
+                      if_exists=True)
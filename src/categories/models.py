@@ -1,20 +1,30 @@
 import datetime
 
 from typing import Dict, Any, List
-from sqlalchemy import func, ForeignKey, String
+from sqlalchemy import func, text, BigInteger, ForeignKey, String, Sequence, Index
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from src.database import Base
+from src.database import Base, CURRENT_TRANSACTION_ID
+
+
+category_id_sequence = Sequence("categories_public_id_seq", start=0, minvalue=0, metadata=Base.metadata)
 
 
 class Category(Base):
     __tablename__ = "categories"
+    __table_args__ = (
+        Index("ix_categories_user_id_change_id", "user_id", "change_id"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
     color: Mapped[str] = mapped_column(default="#FFFFFF", nullable=False)
-    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     created_at: Mapped[datetime.datetime] = mapped_column(default=func.now(), nullable=False)
+    updated_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), onupdate=func.now(),
+                                                          nullable=False)
+    change_id: Mapped[int] = mapped_column(BigInteger, server_default=text(CURRENT_TRANSACTION_ID),
+                                           onupdate=text(CURRENT_TRANSACTION_ID), nullable=False)
 
     user: Mapped["User"] = relationship(back_populates="categories", uselist=False)
     tasks: Mapped[List["Task"]] = relationship(back_populates="category", uselist=True, lazy="selectin",
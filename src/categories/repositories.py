@@ -1,86 +1,102 @@
-import random
-from typing import Optional, List
-from sqlalchemy import insert, select, delete, update, and_
-
-from config_data.config import Config, load_config
-from src.database import async_session
-
-from src.categories.models import Category
+from typing import Optional, List, Set
+from sqlalchemy import select, update, and_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import raiseload, selectinload
+
+from src.database import read_session_scope, session_scope
+from src.fieldsets import FieldSet, load_fields
+from src.id_generator import create_id_generator
+from src.sync.repositories import SyncRepository
+
+from src.categories.models import Category, category_id_sequence
+from src.tasks.models import Task
 from src.categories.schemas import CategoryCreate, CategoryEdit
 
-settings: Config = load_config(".env")
-global_vars = settings.variablesData
+
+id_generator = create_id_generator(category_id_sequence)
 
 
 class CategoryRepository:
 
     async def generate_id(self) -> int:
-        unique_id = random.randint(global_vars.MIN_ID, global_vars.MAX_ID)
-        while await self.get_category_by_id(unique_id):
-            unique_id = random.randint(global_vars.MIN_ID, global_vars.MAX_ID)
-
-        return unique_id
+        return await id_generator.next_id()
 
     async def create_category(self, category: CategoryCreate, user_id: int) -> Category:
         category_dc = category.dict()
         category_dc["user_id"] = user_id
-        category_dc["id"] = await self.generate_id()
-        async with async_session() as session:
-            stmt = insert(Category).values(**category_dc)
-            await session.execute(stmt)
-            await session.commit()
-
-            new_category: Category = await self.get_category_by_id(category_dc["id"])
-            return new_category
+        async with session_scope() as session:
+            new_category: Optional[Category] = None
+            while new_category is None:
+                category_dc["id"] = await self.generate_id()
+                stmt = insert(Category).values(**category_dc).on_conflict_do_nothing(
+                    index_elements=[Category.id]
+                ).returning(Category)
+                result = await session.execute(stmt)
+                new_category = result.scalars().first()
+
+        return new_category
 
     async def get_category_by_id(self, category_id: int) -> Optional[Category]:
-        async with async_session() as session:
+        async with session_scope() as session:
             stmt = select(Category).where(Category.id == category_id)
             result = await session.execute(stmt)
             category = result.scalars().first()
 
             return category
 
+    async def get_user_category_ids(self, user_id: int, category_ids: Set[int]) -> Set[int]:
+        async with session_scope() as session:
+            stmt = select(Category.id).where(and_(Category.user_id == user_id, Category.id.in_(category_ids)))
+            result = await session.execute(stmt)
+            owned_ids = set(result.scalars().all())
+
+        return owned_ids
+
     async def get_all_categories_without_base(self, user_id: int, base_category_id: int) -> List[Category]:
-        async with async_session() as session:
+        async with read_session_scope() as session:
             stmt = select(Category).where(and_(Category.user_id == user_id, Category.id != base_category_id))
             result = await session.execute(stmt)
             categories = result.scalars().all()
 
         return categories
 
-    async def get_all_user_categories(self, user_id: int) -> List[Category]:
-        async with async_session() as session:
+    async def get_all_user_categories(self, user_id: int, fieldset: Optional[FieldSet] = None) -> List[Category]:
+        async with read_session_scope() as session:
             stmt = select(Category).where(Category.user_id == user_id)
+            if fieldset is not None:
+                stmt = stmt.options(
+                    load_fields(Category, fieldset),
+                    selectinload(Category.tasks) if "tasks" in fieldset.include else raiseload(Category.tasks)
+                )
             result = await session.execute(stmt)
             categories = result.scalars().all()
 
         return categories
 
-    async def edit_category(self, category: Category, edited_category: CategoryEdit) -> Category:
+    async def edit_category(self, category_id: int, user_id: int, edited_category: CategoryEdit) -> Optional[Category]:
         category_dc = edited_category.dict()
-        async with async_session() as session:
-            stmt = update(Category).where(Category.id == category.id).values(**category_dc)
-            await session.execute(stmt)
-            await session.commit()
+        async with session_scope() as session:
+            stmt = update(Category).where(
+                and_(Category.id == category_id, Category.user_id == user_id)
+            ).values(**category_dc).returning(Category)
+            result = await session.execute(stmt)
+            category = result.scalars().first()
 
-            category: Category = await self.get_category_by_id(category.id)
-            return category
+        return category
 
-    async def delete_category(self, category: Category) -> None:
-        async with async_session() as session:
-            stmt = delete(Category).where(Category.id == category.id)
-            await session.execute(stmt)
-            await session.commit()
+    async def delete_category(self, category_id: int, user_id: int) -> bool:
+        deleted_ids = await SyncRepository().delete_with_tombstones(
+            Category, Category.id == category_id, Category.user_id == user_id
+        )
+        return len(deleted_ids) > 0
 
     async def delete_all_user_categories(self, user_id: int) -> None:
-        async with async_session() as session:
-            stmt = delete(Category).where(Category.user_id == user_id)
-            await session.execute(stmt)
-            await session.commit()
+        # Deleted explicitly rather than by the foreign key cascade, so the tasks get tombstones too
+        sync_repository = SyncRepository()
+        await sync_repository.delete_with_tombstones(Task, Task.user_id == user_id)
+        await sync_repository.delete_with_tombstones(Category, Category.user_id == user_id)
 
     async def delete_all_categories(self) -> None:
-        async with async_session() as session:
-            stmt = delete(Category)
-            await session.execute(stmt)
-            await session.commit()
+        sync_repository = SyncRepository()
+        await sync_repository.delete_with_tombstones(Task)
+        await sync_repository.delete_with_tombstones(Category)
@@ -1,27 +1,35 @@
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Request, Response
 from typing import Annotated, List
 
-from src.categories.schemas import CategoryResponse, CategoryCreate, CategoryEdit, SuccessfulResponse
+from src.categories.schemas import CategoryResponse, CategoryCreate, CategoryEdit, SuccessfulResponse, \
+    CategoryPartialResponse
+from src.fieldsets import FieldSet, FieldSetQuery, dump_fields
 from src.categories.services import CategoryService
 
-from src.tasks.services import TaskService
-from src.users.models import User
+from src.users.schemas import UserPrincipal
+from src.users.data_versions import check_not_modified
 from src.users.services import UserService
 
 router = APIRouter(tags=["categories"], prefix="/categories")
 
 
-@router.get("/", response_model=List[CategoryResponse])
+@router.get("/", response_model=List[CategoryPartialResponse], response_model_exclude_unset=True)
 async def get_all_categories(
-        current_user: Annotated[User, Depends(UserService().get_current_user)]
-) -> List[CategoryResponse]:
-    categories = await CategoryService().get_all_user_categories(current_user.id)
-    return list(map(lambda x: CategoryResponse(**x.to_dict()), categories))
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
+        request: Request,
+        response: Response,
+        fieldset: Annotated[FieldSet, Depends(FieldSetQuery(CategoryPartialResponse, relations=("tasks",)))]
+) -> List[CategoryPartialResponse]:
+    await check_not_modified(request, response, current_user.id)
+    categories = await CategoryService().get_all_user_categories(current_user.id, fieldset)
+    return [
+        CategoryPartialResponse(**dump_fields(category, fieldset.fields, fieldset.include)) for category in categories
+    ]
 
 
 @router.get("/no_base", response_model=List[CategoryResponse])
 async def get_all_categories_without_base(
-        current_user: Annotated[User, Depends(UserService().get_current_user)]
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)]
 ) -> List[CategoryResponse]:
     categories = await CategoryService().get_all_categories_without_base(current_user)
     return list(map(lambda x: CategoryResponse(**x.to_dict()), categories))
@@ -29,7 +37,7 @@ async def get_all_categories_without_base(
 
 @router.get("/{category_id}", response_model=CategoryResponse)
 async def get_category(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],  # noqa
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],  # noqa
         category_id: int
 ) -> CategoryResponse:
     category = await CategoryService().get_user_category_by_id(category_id, current_user)
@@ -38,7 +46,7 @@ async def get_category(
 
 @router.post("/", response_model=CategoryResponse)
 async def create_category(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         new_category: CategoryCreate
 ) -> CategoryResponse:
     category = await CategoryService().create_category(new_category, current_user.id)
@@ -47,7 +55,7 @@ async def create_category(
 
 @router.put("/{category_id}", response_model=CategoryResponse)
 async def edit_category(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         category_id: int,
         edited_category: CategoryEdit
 ) -> CategoryResponse:
@@ -57,14 +65,8 @@ async def edit_category(
 
 @router.delete("/{category_id}", response_model=SuccessfulResponse)
 async def delete_category(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         category_id: int
 ) -> SuccessfulResponse:
-    category = await CategoryService().get_category_by_id(category_id, current_user)
-    tasks_from_category = await TaskService().get_all_tasks_from_category(category, current_user)
-
-    for task in tasks_from_category:
-        await TaskService().set_base_category_for_task(task, current_user)
-
-    await CategoryService().delete_category(category, current_user)
+    await CategoryService().delete_category(category_id, current_user)
     return SuccessfulResponse()
@@ -1,4 +1,4 @@
-from typing import List, Annotated
+from typing import List, Annotated, Optional
 from pydantic import BaseModel, Field
 
 from src.tasks.schemas import TaskResponse
@@ -23,3 +23,10 @@ class CategoryResponse(BaseModel):
     name: Annotated[str, Field(min_length=1, max_length=50)]
     color: str
     tasks: List[TaskResponse]
+
+
+class CategoryPartialResponse(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    color: Optional[str] = None
+    tasks: Optional[List[TaskResponse]] = None
@@ -1,50 +1,72 @@
-from typing import List
+from typing import List, Optional, Set
 
 from src.categories.models import Category
 from src.categories.repositories import CategoryRepository
 from src.categories.schemas import CategoryCreate, CategoryEdit
 from src.categories.exceptions import NotFoundException
 
-from src.users.models import User
+from src.database import session_scope
+from src.fieldsets import FieldSet
+from src.users.data_versions import bump_data_version, bump_all_data_versions
+from src.tasks.repositories import TaskRepository
+
+from src.users.schemas import UserPrincipal
 
 
 class CategoryService:
     repository = CategoryRepository()
 
     async def create_category(self, category: CategoryCreate, user_id: int) -> Category:
-        return await self.repository.create_category(category, user_id)
+        category = await self.repository.create_category(category, user_id)
+        await bump_data_version(user_id)
+
+        return category
 
-    async def edit_category(self, category_edit: CategoryEdit, category_id: int, user: User) -> Category:
-        category = await self.get_category_by_id(category_id, user)
-        if category.id == user.base_category_id:
+    async def edit_category(self, category_edit: CategoryEdit, category_id: int, user: UserPrincipal) -> Category:
+        if category_id == user.base_category_id:
             raise NotFoundException()
 
-        return await self.repository.edit_category(category, category_edit)
+        category = await self.repository.edit_category(category_id, user.id, category_edit)
+        if category is None:
+            raise NotFoundException()
 
-    async def get_category_by_id(self, category_id: int, user: User) -> Category:
+        await bump_data_version(user.id)
+        return category
+
+    async def get_category_by_id(self, category_id: int, user: UserPrincipal) -> Category:
         category = await self.repository.get_category_by_id(category_id)
         if category is None or category.user_id != user.id:
             raise NotFoundException()
 
         return category
 
-    async def get_user_category_by_id(self, category_id: int, user: User) -> Category:
+    async def get_user_category_ids(self, category_ids: Set[int], user: UserPrincipal) -> Set[int]:
+        return await self.repository.get_user_category_ids(user.id, category_ids)
+
+    async def get_user_category_by_id(self, category_id: int, user: UserPrincipal) -> Category:
         return await self.get_category_by_id(category_id, user)
 
-    async def get_all_categories_without_base(self, user: User) -> List[Category]:
+    async def get_all_categories_without_base(self, user: UserPrincipal) -> List[Category]:
         return await self.repository.get_all_categories_without_base(user.id, user.base_category_id)
 
-    async def get_all_user_categories(self, user_id: int) -> List[Category]:
-        return await self.repository.get_all_user_categories(user_id)
+    async def get_all_user_categories(self, user_id: int, fieldset: Optional[FieldSet] = None) -> List[Category]:
+        return await self.repository.get_all_user_categories(user_id, fieldset)
 
-    async def delete_category(self, category: Category, user: User) -> None:
-        if category is None or category.user_id != user.id or category.id == user.base_category_id:
+    async def delete_category(self, category_id: int, user: UserPrincipal) -> None:
+        if category_id == user.base_category_id:
             raise NotFoundException()
 
-        return await self.repository.delete_category(category)
+        # Tasks of the category go to the base category, in the same transaction as the delete
+        async with session_scope():
+            await TaskRepository().move_tasks_to_category(category_id, user.base_category_id, user.id)
+            if not await self.repository.delete_category(category_id, user.id):
+                raise NotFoundException()
+            await bump_data_version(user.id)
 
     async def delete_all_user_categories(self, user_id: int) -> None:
         await self.repository.delete_all_user_categories(user_id)
+        await bump_data_version(user_id)
 
     async def delete_all_categories(self) -> None:
         await self.repository.delete_all_categories()
+        await bump_all_data_versions()
@@ -1,22 +1,204 @@
-from sqlalchemy import text
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs, AsyncSession
-from sqlalchemy.orm import DeclarativeBase
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from uuid import uuid4
+
+from sqlalchemy import Connection, URL, event, make_url, text
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncAttrs, AsyncEngine, AsyncSession
+from sqlalchemy.orm import DeclarativeBase, ORMExecuteState, Session
 
 from config_data.config import Config, load_config
 
 config: Config = load_config(".env")
-DATABASE_URL = config.database.DATABASE_URL
+database_config = config.database
+DATABASE_URL = database_config.DATABASE_URL
+
+POOLER_MODES = ("none", "transaction")
+if database_config.POOLER_MODE not in POOLER_MODES:
+    raise ValueError(f"Unknown pooler mode {database_config.POOLER_MODE!r}")
+
+connect_args: Dict[str, Any] = {
+    "statement_cache_size": database_config.STATEMENT_CACHE_SIZE,
+    "server_settings": database_config.server_settings,
+}
+# Settings applied with SET LOCAL at the start of every transaction
+transaction_settings: Dict[str, str] = {}
+
+if database_config.POOLER_MODE == "transaction":
+    # Every transaction may run on another server connection, so nothing may outlive it: prepared
+    # statements get unique names and aren't cached, and the startup packet carries only what
+    # the pooler accepts
+    connect_args = {
+        "statement_cache_size": 0,
+        "prepared_statement_name_func": lambda: f"__asyncpg_{uuid4().hex}__",
+        "server_settings": {"application_name": database_config.APPLICATION_NAME},
+    }
+    transaction_settings = {
+        name: value for name, value in database_config.server_settings.items() if name != "application_name"
+    }
+
+# Migrations build indexes and rewrite tables, the request statement timeout would abort them. Behind a
+# transaction pooler the server settings are applied per transaction and don't reach migrations anyway
+migration_connect_args: Dict[str, Any] = connect_args
+if database_config.POOLER_MODE == "none":
+    migration_connect_args = {
+        **connect_args,
+        "server_settings": {**connect_args["server_settings"], "statement_timeout": "0"},
+    }
+
+
+def _engine_url(url: str) -> URL:
+    if database_config.POOLER_MODE == "transaction":
+        return make_url(url).update_query_dict({"prepared_statement_cache_size": "0"})
+    return make_url(url)
+
+
+def apply_transaction_settings(connection: Connection) -> None:
+    params = {}
+    for i, (name, value) in enumerate(transaction_settings.items()):
+        params[f"name_{i}"], params[f"value_{i}"] = name, value
+    columns = ", ".join(f"set_config(:name_{i}, :value_{i}, true)" for i in range(len(transaction_settings)))
+    connection.execute(text(f"SELECT {columns}"), params)
+
 
+def _create_engine(url: URL) -> AsyncEngine:
+    new_engine = create_async_engine(
+        url,
+        pool_size=database_config.POOL_SIZE,
+        max_overflow=database_config.MAX_OVERFLOW,
+        pool_timeout=database_config.POOL_TIMEOUT,
+        pool_recycle=database_config.POOL_RECYCLE,
+        pool_pre_ping=database_config.POOL_PRE_PING,
+        connect_args=connect_args,
+    )
+    if transaction_settings:
+        event.listen(new_engine.sync_engine, "begin", apply_transaction_settings)
+    return new_engine
+
+
+engine_url = _engine_url(DATABASE_URL)
 # engine = create_async_engine(DATABASE_URL, echo=True)
-engine = create_async_engine(DATABASE_URL)
-async_session = async_sessionmaker(engine)
+engine = _create_engine(engine_url)
+async_session = async_sessionmaker(engine, expire_on_commit=False)
+
+# Optional read-only replica for reads that don't need to see the request's own writes
+replica_engine: Optional[AsyncEngine] = None
+replica_session: Optional[async_sessionmaker[AsyncSession]] = None
+if database_config.REPLICA_DATABASE_URL is not None:
+    replica_engine = _create_engine(_engine_url(database_config.REPLICA_DATABASE_URL))
+    replica_session = async_sessionmaker(replica_engine, expire_on_commit=False)
+
+# Id of the writing transaction. Transactions a snapshot doesn't see have ids of at least the
+# snapshot's xmin, which makes these ids usable as sync cursors, see src/sync
+CURRENT_TRANSACTION_ID = "pg_current_xact_id()::text::bigint"
+
+# Session of the current unit of work, shared by all repositories
+current_session: ContextVar[Optional[AsyncSession]] = ContextVar("current_session", default=None)
+current_replica_session: ContextVar[Optional[AsyncSession]] = ContextVar("current_replica_session", default=None)
 
 
-async def get_async_session() -> AsyncSession:
+@event.listens_for(Session, "do_orm_execute")
+def _track_writes(orm_execute_state: ORMExecuteState) -> None:
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["has_writes"] = True
+
+
+async def _commit(session: AsyncSession) -> None:
+    await session.commit()
+    callbacks = session.info.pop("after_commit", [])
+    for callback in callbacks:
+        callback()
+
+
+@asynccontextmanager
+async def session_scope() -> AsyncIterator[AsyncSession]:
+    session = current_session.get()
+    if session is not None:
+        yield session
+        return
+
     async with async_session() as session:
+        token = current_session.set(session)
+        try:
+            yield session
+            await _commit(session)
+        finally:
+            current_session.reset(token)
+
+
+@asynccontextmanager
+async def separate_session_scope() -> AsyncIterator[AsyncSession]:
+    # A unit of work of its own, committed on its own, even inside the one of a request
+    token = current_session.set(None)
+    try:
+        async with session_scope() as session:
+            yield session
+    finally:
+        current_session.reset(token)
+
+
+@asynccontextmanager
+async def replica_session_scope() -> AsyncIterator[Optional[AsyncSession]]:
+    session = current_replica_session.get()
+    if session is not None or replica_session is None:
+        yield session
+        return
+
+    # Read only, closing the session rolls its transaction back
+    async with replica_session() as session:
+        token = current_replica_session.set(session)
+        try:
+            yield session
+        finally:
+            current_replica_session.reset(token)
+
+
+@asynccontextmanager
+async def read_session_scope() -> AsyncIterator[AsyncSession]:
+    # Reads go to the replica, unless the unit of work already wrote something and
+    # has to see its own writes
+    session = current_session.get()
+    if replica_session is None or (session is not None and session.info.get("has_writes")):
+        async with session_scope() as session:
+            yield session
+        return
+
+    async with replica_session_scope() as session:
         yield session
 
 
+async def get_async_session() -> AsyncIterator[AsyncSession]:
+    # Sessions connect lazily, so the replica costs nothing to requests that don't read from it
+    async with session_scope() as session, replica_session_scope():
+        yield session
+
+
+async def end_transaction() -> None:
+    # Commits the work done so far and returns the connection to the pool
+    session = current_session.get()
+    if session is not None:
+        await _commit(session)
+
+
+def after_commit(callback: Callable[[], None]) -> None:
+    session = current_session.get()
+    if session is None:
+        callback()
+    else:
+        session.info.setdefault("after_commit", []).append(callback)
+
+
+def get_pool_stats() -> Dict[str, int]:
+    pool = engine.pool
+    return {
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": max(pool.overflow(), 0),
+        "max_overflow": database_config.MAX_OVERFLOW,
+    }
+
+
 async def clear_tables():
     async with async_session() as session:
         await session.execute(text("DELETE FROM tasks"))
@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Sequence, Tuple, Type
+
+from fastapi import HTTPException, status
+from pydantic import BaseModel
+from sqlalchemy import inspect
+from sqlalchemy.orm import Load, load_only
+
+
+class InvalidFieldsException(HTTPException):
+    status_code = status.HTTP_400_BAD_REQUEST
+
+    def __init__(self, name: str):
+        super().__init__(status_code=self.status_code, detail=f"Unknown field {name!r}")
+
+
+@dataclass(frozen=True)
+class FieldSet:
+    # Scalar fields of the resource and the relations embedded into it, "a.b" embeds b into a
+    fields: Tuple[str, ...]
+    include: Tuple[str, ...]
+
+
+def _parse_names(value: Optional[str], allowed: Sequence[str]) -> Tuple[str, ...]:
+    if value is None:
+        return tuple(allowed)
+
+    names = tuple(dict.fromkeys(name.strip() for name in value.split(",") if name.strip()))
+    for name in names:
+        if name not in allowed:
+            raise InvalidFieldsException(name)
+    return names
+
+
+# Dependency for the `fields` and `include` query parameters of a list endpoint. Either one left
+# out means all of them, so without parameters the endpoint returns the full response.
+class FieldSetQuery:
+    def __init__(self, response_model: Type[BaseModel], relations: Sequence[str] = ()):
+        self.relations = tuple(relations)
+        self.fields = tuple(name for name in response_model.model_fields if name not in self.relations)
+
+    def __call__(self, fields: Optional[str] = None, include: Optional[str] = None) -> FieldSet:
+        relations = _parse_names(include, self.relations)
+        # Embedding into a relation embeds the relation itself
+        parents = tuple(name.rsplit(".", 1)[0] for name in relations if "." in name)
+        return FieldSet(_parse_names(fields, self.fields), tuple(dict.fromkeys(parents + relations)))
+
+
+def dump_fields(entity: Any, fields: Sequence[str], include: Sequence[str] = ()) -> Dict[str, Any]:
+    values = {name: getattr(entity, name) for name in fields}
+    for relation in include:
+        if "." in relation:
+            continue
+        # Embedded entities are loaded whole but for deferred columns, only their own relations are optional
+        prefix = relation + "."
+        nested_include = [name[len(prefix):] for name in include if name.startswith(prefix)]
+        values[relation] = [
+            dump_fields(
+                item,
+                [column.key for column in inspect(item).mapper.column_attrs if not column.deferred],
+                nested_include
+            )
+            for item in getattr(entity, relation)
+        ]
+    return values
+
+
+def load_fields(model: Any, fieldset: FieldSet, *required: Any) -> Load:
+    # Narrows the SELECT to the requested columns and the required ones, the primary key is always loaded
+    columns = [getattr(model, name) for name in fieldset.fields]
+    return load_only(*columns, *required, model.id, raiseload=True)
@@ -0,0 +1,87 @@
+import asyncio
+import hashlib
+from collections import deque
+from typing import Deque, List
+
+from sqlalchemy import Sequence, select, func
+
+from config_data.config import Config, load_config
+from src.database import session_scope
+
+settings: Config = load_config(".env")
+global_vars = settings.variablesData
+
+
+# Balanced Feistel network over the smallest even number of bits that covers the domain.
+# Values that land outside the domain are encrypted again (cycle walking), so the result
+# is a bijection of [0, domain_size) onto itself.
+class FeistelPermutation:
+    def __init__(self, domain_size: int, key: int, rounds: int = 4):
+        if domain_size < 1:
+            raise ValueError("domain_size must be positive")
+
+        self.domain_size = domain_size
+        self.half_bits = max(1, ((domain_size - 1).bit_length() + 1) // 2)
+        self.half_mask = (1 << self.half_bits) - 1
+        self.round_keys = [
+            hashlib.blake2b(f"{key}:{i}".encode(), digest_size=8).digest()
+            for i in range(rounds)
+        ]
+
+    def _round(self, value: int, round_key: bytes) -> int:
+        digest = hashlib.blake2b(value.to_bytes(8, "big"), digest_size=8, key=round_key).digest()
+        return int.from_bytes(digest, "big") & self.half_mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half_bits, value & self.half_mask
+        for round_key in self.round_keys:
+            left, right = right, left ^ self._round(right, round_key)
+        return (left << self.half_bits) | right
+
+    def permute(self, value: int) -> int:
+        if not 0 <= value < self.domain_size:
+            raise ValueError(f"{value} is outside of [0, {self.domain_size})")
+
+        value = self._encrypt(value)
+        while value >= self.domain_size:
+            value = self._encrypt(value)
+        return value
+
+
+# Public ids are the values of a DB sequence permuted into [min_id, max_id]. The sequence
+# makes them unique across processes, the permutation keeps them non-sequential, and
+# sequence values are reserved in blocks so most ids need no round trip at all.
+class IdGenerator:
+    def __init__(self, sequence: Sequence, min_id: int, max_id: int, key: int, block_size: int):
+        self.sequence = sequence
+        self.min_id = min_id
+        self.block_size = block_size
+        self.permutation = FeistelPermutation(max_id - min_id + 1, key)
+        self._block: Deque[int] = deque()
+        self._lock = asyncio.Lock()
+
+    async def _reserve_block(self) -> List[int]:
+        async with session_scope() as session:
+            query = select(self.sequence.next_value()).select_from(func.generate_series(1, self.block_size))
+            result = await session.execute(query)
+            return list(result.scalars().all())
+
+    async def next_id(self) -> int:
+        async with self._lock:
+            if not self._block:
+                self._block.extend(await self._reserve_block())
+            index = self._block.popleft()
+
+        if index >= self.permutation.domain_size:
+            raise RuntimeError(f"Ids of {self.sequence.name} are exhausted")
+        return self.min_id + self.permutation.permute(index)
+
+
+def create_id_generator(sequence: Sequence) -> IdGenerator:
+    return IdGenerator(
+        sequence,
+        min_id=global_vars.MIN_ID,
+        max_id=global_vars.MAX_ID,
+        key=global_vars.ID_KEY,
+        block_size=global_vars.ID_BLOCK_SIZE
+    )
@@ -0,0 +1,21 @@
+import datetime
+
+from sqlalchemy import func, text, BigInteger, ForeignKey, String, Index
+from sqlalchemy.orm import Mapped, mapped_column
+
+from src.database import Base, CURRENT_TRANSACTION_ID
+
+
+# Marks a deleted task or category until clients have synced the delete
+class Tombstone(Base):
+    __tablename__ = "tombstones"
+    __table_args__ = (
+        Index("ix_tombstones_user_id_change_id", "user_id", "change_id"),
+    )
+
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    entity: Mapped[str] = mapped_column(String(20), nullable=False)
+    entity_id: Mapped[int] = mapped_column(nullable=False)
+    user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    deleted_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), nullable=False)
+    change_id: Mapped[int] = mapped_column(BigInteger, server_default=text(CURRENT_TRANSACTION_ID), nullable=False)
@@ -0,0 +1,47 @@
+from typing import Any, List, Tuple
+
+from sqlalchemy import select, delete, and_, literal, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import raiseload
+
+from src.database import read_session_scope, session_scope
+from src.categories.models import Category
+from src.tasks.models import Task
+from src.sync.models import Tombstone
+
+
+class SyncRepository:
+
+    async def delete_with_tombstones(self, model: Any, *criteria: Any) -> List[int]:
+        # The rows and their tombstones are written by one statement
+        async with session_scope() as session:
+            deleted = delete(model).where(*criteria).returning(model.id, model.user_id).cte("deleted")
+            stmt = insert(Tombstone).from_select(
+                [Tombstone.entity, Tombstone.entity_id, Tombstone.user_id],
+                select(literal(model.__tablename__), deleted.c.id, deleted.c.user_id)
+            ).returning(Tombstone.entity_id)
+            result = await session.execute(stmt)
+            deleted_ids = result.scalars().all()
+
+        return deleted_ids
+
+    async def get_changes(
+            self,
+            user_id: int,
+            since: int
+    ) -> Tuple[List[Task], List[Category], List[Tombstone], int]:
+        async with read_session_scope() as session:
+            # Read before the changes: whatever commits later has a change id of at least this
+            result = await session.execute(text("SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"))
+            cursor = result.scalar_one()
+
+            stmt = select(Task).where(and_(Task.user_id == user_id, Task.change_id >= since))
+            tasks = (await session.execute(stmt)).scalars().all()
+            stmt = select(Category).where(
+                and_(Category.user_id == user_id, Category.change_id >= since)
+            ).options(raiseload(Category.tasks))
+            categories = (await session.execute(stmt)).scalars().all()
+            stmt = select(Tombstone).where(and_(Tombstone.user_id == user_id, Tombstone.change_id >= since))
+            tombstones = (await session.execute(stmt)).scalars().all()
+
+        return tasks, categories, tombstones, cursor
@@ -0,0 +1,33 @@
+from typing import Annotated, Optional
+
+from fastapi import APIRouter, Depends
+
+from src.fieldsets import dump_fields
+from src.sync.schemas import SyncResponse, SyncTaskResponse, SyncCategoryResponse, TombstoneResponse
+from src.sync.services import SyncService
+
+from src.users.schemas import UserPrincipal
+from src.users.services import UserService
+
+router = APIRouter(tags=["sync"], prefix="/sync")
+
+
+# Tasks and categories changed since the cursor, and the ones deleted since then. A row can
+# come again in the next response, applying it twice does no harm
+@router.get("", response_model=SyncResponse)
+async def get_changes(
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
+        since: Optional[str] = None
+) -> SyncResponse:
+    tasks, categories, tombstones, cursor = await SyncService().get_changes(current_user.id, since)
+    return SyncResponse(
+        cursor=cursor,
+        tasks=[SyncTaskResponse(**dump_fields(task, SyncTaskResponse.model_fields)) for task in tasks],
+        categories=[
+            SyncCategoryResponse(**dump_fields(category, SyncCategoryResponse.model_fields)) for category in categories
+        ],
+        deleted=[
+            TombstoneResponse(entity=tombstone.entity, id=tombstone.entity_id, deleted_at=tombstone.deleted_at)
+            for tombstone in tombstones
+        ]
+    )
@@ -0,0 +1,30 @@
+import datetime
+from typing import List
+from pydantic import BaseModel
+
+from src.tasks.schemas import TaskResponse
+
+
+class SyncTaskResponse(TaskResponse):
+    updated_at: datetime.datetime
+
+
+class SyncCategoryResponse(BaseModel):
+    id: int
+    name: str
+    color: str
+    updated_at: datetime.datetime
+
+
+class TombstoneResponse(BaseModel):
+    entity: str
+    id: int
+    deleted_at: datetime.datetime
+
+
+class SyncResponse(BaseModel):
+    # Pass it as `since` to get the changes made after this response
+    cursor: str
+    tasks: List[SyncTaskResponse]
+    categories: List[SyncCategoryResponse]
+    deleted: List[TombstoneResponse]
@@ -0,0 +1,28 @@
+from typing import List, Optional, Tuple
+
+from src.categories.models import Category
+from src.sync.models import Tombstone
+from src.sync.repositories import SyncRepository
+from src.tasks.exceptions import InvalidCursorException
+from src.tasks.models import Task
+from utils.cursor import encode_cursor, decode_cursor
+
+
+class SyncService:
+    repository = SyncRepository()
+
+    async def get_changes(
+            self,
+            user_id: int,
+            since: Optional[str]
+    ) -> Tuple[List[Task], List[Category], List[Tombstone], str]:
+        # Without a cursor everything counts as changed
+        change_id = 0
+        if since is not None:
+            try:
+                change_id = int(decode_cursor(since)["change_id"])
+            except (ValueError, KeyError, TypeError):
+                raise InvalidCursorException()
+
+        tasks, categories, tombstones, cursor = await self.repository.get_changes(user_id, change_id)
+        return tasks, categories, tombstones, encode_cursor({"change_id": cursor})
@@ -8,3 +8,12 @@ class NotFoundException(HTTPException):
 
     def __init__(self):
         super().__init__(status_code=self.status_code, detail=self.detail)
+
+
+class InvalidCursorException(HTTPException):
+
+    status_code = status.HTTP_400_BAD_REQUEST
+    detail = "Invalid cursor"
+
+    def __init__(self):
+        super().__init__(status_code=self.status_code, detail=self.detail)
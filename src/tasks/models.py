@@ -2,10 +2,11 @@ import datetime
 
 from enum import Enum
 from typing import Dict, Any
-from sqlalchemy import ForeignKey, String
+from sqlalchemy import func, text, BigInteger, Computed, ForeignKey, String, Sequence, Index
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
-from src.database import Base
+from src.database import Base, CURRENT_TRANSACTION_ID
 
 
 class Priority(Enum):
@@ -14,8 +15,24 @@ class Priority(Enum):
     HIGH = 3
 
 
+# The simple configuration doesn't stem, so search works the same for every language
+TASK_SEARCH_CONFIG = "simple"
+TASK_SEARCH_VECTOR = (
+    f"setweight(to_tsvector('{TASK_SEARCH_CONFIG}', name), 'A') || "
+    f"setweight(to_tsvector('{TASK_SEARCH_CONFIG}', coalesce(description, '')), 'B')"
+)
+
+task_id_sequence = Sequence("tasks_public_id_seq", start=0, minvalue=0, metadata=Base.metadata)
+
+
 class Task(Base):
     __tablename__ = "tasks"
+    __table_args__ = (
+        # Also serves lookups by user_id alone
+        Index("ix_tasks_user_id_date", "user_id", "date"),
+        Index("ix_tasks_user_id_change_id", "user_id", "change_id"),
+        Index("ix_tasks_search_vector", "search_vector", postgresql_using="gin"),
+    )
 
     id: Mapped[int] = mapped_column(primary_key=True)
     name: Mapped[str] = mapped_column(String(100), nullable=False)
@@ -23,8 +40,15 @@ class Task(Base):
     priority: Mapped[Priority] = mapped_column(default=Priority.MEDIUM, nullable=False)
     completed: Mapped[bool] = mapped_column(default=False, nullable=False)
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    category_id: Mapped[int] = mapped_column(ForeignKey("categories.id", ondelete="CASCADE"), nullable=False)
+    category_id: Mapped[int] = mapped_column(ForeignKey("categories.id", ondelete="CASCADE"), nullable=False, index=True)
     date: Mapped[datetime.date] = mapped_column(nullable=False)
+    updated_at: Mapped[datetime.datetime] = mapped_column(server_default=func.now(), onupdate=func.now(),
+                                                          nullable=False)
+    change_id: Mapped[int] = mapped_column(BigInteger, server_default=text(CURRENT_TRANSACTION_ID),
+                                           onupdate=text(CURRENT_TRANSACTION_ID), nullable=False)
+    # Search document, matches in the name rank above matches in the description
+    search_vector: Mapped[str] = mapped_column(TSVECTOR, Computed(TASK_SEARCH_VECTOR, persisted=True),
+                                               deferred=True, nullable=False)
 
     user: Mapped["User"] = relationship(back_populates="tasks", uselist=False)
     category: Mapped["Category"] = relationship(back_populates="tasks", uselist=False)
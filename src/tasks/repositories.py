@@ -1,116 +1,196 @@
-import random
-from typing import Optional, List
+import datetime
+from typing import Optional, List, Tuple, Dict, Sequence
 
-from sqlalchemy import insert, select, delete, update
+from sqlalchemy import Row, cast, func, select, update, not_, and_, or_, exists, tuple_
+from sqlalchemy.dialects.postgresql import REGCONFIG, insert
 
-from config_data.config import Config, load_config
-from src.tasks.models import Task
-from src.tasks.schemas import TaskCreate, TaskEdit
+from src.tasks.models import Task, task_id_sequence, TASK_SEARCH_CONFIG
+from src.categories.models import Category
+from src.tasks.schemas import TaskCreate, TaskEdit, TaskFilters
 
-from src.database import async_session
+from src.database import read_session_scope, session_scope
+from src.fieldsets import FieldSet, load_fields
+from src.id_generator import create_id_generator
+from src.sync.repositories import SyncRepository
 
-settings: Config = load_config(".env")
-global_vars = settings.variablesData
+
+id_generator = create_id_generator(task_id_sequence)
 
 
 class TaskRepository:
 
     async def generate_id(self) -> int:
-        unique_id = random.randint(global_vars.MIN_ID, global_vars.MAX_ID)
-        while await self.get_task_by_id(unique_id):
-            unique_id = random.randint(global_vars.MIN_ID, global_vars.MAX_ID)
-
-        return unique_id
+        return await id_generator.next_id()
 
     async def create_task(self, task: TaskCreate, user_id: int) -> Task:
         task_dc = task.dict()
         task_dc["user_id"] = user_id
-        task_dc["id"] = await self.generate_id()
-        async with async_session() as session:
-            stmt = insert(Task).values(**task_dc)
-            await session.execute(stmt)
-            await session.commit()
-
-            new_task: Task = await self.get_task_by_id(task_dc["id"])
-            return new_task
+        async with session_scope() as session:
+            new_task: Optional[Task] = None
+            while new_task is None:
+                # Rows created before the generator may hold a generated id, skip it then
+                task_dc["id"] = await self.generate_id()
+                stmt = insert(Task).values(**task_dc).on_conflict_do_nothing(index_elements=[Task.id]).returning(Task)
+                result = await session.execute(stmt)
+                new_task = result.scalars().first()
+
+        return new_task
+
+    async def create_tasks(self, tasks: List[TaskCreate], user_id: int) -> List[Task]:
+        if not tasks:
+            return []
+
+        rows = [{**task.dict(), "user_id": user_id} for task in tasks]
+        created: Dict[int, Task] = {}
+        async with session_scope() as session:
+            pending = rows
+            while pending:
+                # One multi-row insert, rows whose generated id was taken get another one
+                for row in pending:
+                    row["id"] = await self.generate_id()
+                stmt = insert(Task).values(pending).on_conflict_do_nothing(index_elements=[Task.id]).returning(Task)
+                result = await session.execute(stmt)
+                created.update((task.id, task) for task in result.scalars().all())
+                pending = [row for row in pending if row["id"] not in created]
+
+        return [created[row["id"]] for row in rows]
 
     async def get_task_by_id(self, task_id: int) -> Optional[Task]:
-        async with async_session() as session:
+        async with session_scope() as session:
             stmt = select(Task).where(Task.id == task_id)
             result = await session.execute(stmt)
             task = result.scalars().first()
 
             return task
 
-    async def get_all_user_tasks(self, user_id: int) -> List[Task]:
-        async with async_session() as session:
-            stmt = select(Task).where(Task.user_id == user_id)
+    async def get_user_tasks_page(
+            self,
+            user_id: int,
+            filters: TaskFilters,
+            after: Optional[Tuple[datetime.date, int]],
+            limit: int,
+            fieldset: Optional[FieldSet] = None
+    ) -> List[Task]:
+        conditions = [Task.user_id == user_id]
+        if filters.completed is not None:
+            conditions.append(Task.completed == filters.completed)
+        if filters.priority is not None:
+            conditions.append(Task.priority == filters.priority)
+        if filters.category_id is not None:
+            conditions.append(Task.category_id == filters.category_id)
+        if filters.date_from is not None:
+            conditions.append(Task.date >= filters.date_from)
+        if filters.date_to is not None:
+            conditions.append(Task.date <= filters.date_to)
+        if after is not None:
+            conditions.append(tuple_(Task.date, Task.id) > tuple_(*after))
+
+        async with read_session_scope() as session:
+            stmt = select(Task).where(*conditions).order_by(Task.date, Task.id).limit(limit)
+            if fieldset is not None:
+                # The date is part of the cursor
+                stmt = stmt.options(load_fields(Task, fieldset, Task.date))
             result = await session.execute(stmt)
             tasks = result.scalars().all()
         return tasks
 
-    async def edit_task(self, task: Task, edited_task: TaskEdit) -> Task:
-        task_dc = edited_task.dict()
-        async with async_session() as session:
-            stmt = update(Task).where(Task.id == task.id).values(**task_dc)
-            await session.execute(stmt)
-            await session.commit()
-
-            task: Task = await self.get_task_by_id(task.id)
-            return task
+    async def search_user_tasks(
+            self,
+            user_id: int,
+            query: str,
+            after: Optional[Tuple[float, int]],
+            limit: int
+    ) -> List[Tuple[Task, float]]:
+        # Best matches first, ties in id order. The query takes quoted phrases, OR and -word
+        ts_query = func.websearch_to_tsquery(cast(TASK_SEARCH_CONFIG, REGCONFIG), query)
+        rank = func.ts_rank(Task.search_vector, ts_query)
+        conditions = [Task.user_id == user_id, Task.search_vector.bool_op("@@")(ts_query)]
+        if after is not None:
+            conditions.append(or_(rank < after[0], and_(rank == after[0], Task.id > after[1])))
+
+        async with read_session_scope() as session:
+            stmt = select(Task, rank).where(*conditions).order_by(rank.desc(), Task.id).limit(limit)
+            result = await session.execute(stmt)
+            tasks = result.tuples().all()
+        return tasks
 
-    async def change_task_status(self, task: Task) -> Task:
-        async with async_session() as session:
-            stmt = update(Task).where(Task.id == task.id).values(completed=False if task.completed else True)
-            await session.execute(stmt)
-            await session.commit()
+    async def get_user_task_stats(self, user_id: int, today: datetime.date) -> Sequence[Row]:
+        # One row per (completed, priority, category_id) group, overdue and due today count unfinished tasks
+        unfinished = not_(Task.completed)
+        async with read_session_scope() as session:
+            stmt = select(
+                Task.completed,
+                Task.priority,
+                Task.category_id,
+                func.count().label("count"),
+                func.count().filter(and_(unfinished, Task.date < today)).label("overdue"),
+                func.count().filter(and_(unfinished, Task.date == today)).label("due_today"),
+            ).where(Task.user_id == user_id).group_by(Task.completed, Task.priority, Task.category_id)
+            result = await session.execute(stmt)
+            rows = result.all()
+        return rows
 
-            task: Task = await self.get_task_by_id(task.id)
-            return task
+    async def edit_task(self, task_id: int, user_id: int, edited_task: TaskEdit) -> Optional[Task]:
+        task_dc = edited_task.dict()
+        async with session_scope() as session:
+            stmt = update(Task).where(
+                and_(
+                    Task.id == task_id,
+                    Task.user_id == user_id,
+                    exists().where(and_(Category.id == edited_task.category_id, Category.user_id == user_id))
+                )
+            ).values(**task_dc).returning(Task)
+            result = await session.execute(stmt)
+            task = result.scalars().first()
 
-    async def set_base_category_for_task(self, task: Task, base_category_id: int):
-        async with async_session() as session:
-            stmt = update(Task).where(Task.id == task.id).values(category_id=base_category_id)
-            await session.execute(stmt)
-            await session.commit()
+        return task
 
-            task: Task = await self.get_task_by_id(task.id)
-            return task
+    async def change_task_status(self, task_id: int, user_id: int) -> Optional[Task]:
+        async with session_scope() as session:
+            stmt = update(Task).where(
+                and_(Task.id == task_id, Task.user_id == user_id)
+            ).values(completed=not_(Task.completed)).returning(Task)
+            result = await session.execute(stmt)
+            task = result.scalars().first()
 
-    async def delete_task(self, task: Task) -> None:
-        async with async_session() as session:
-            stmt = delete(Task).where(Task.id == task.id)
-            await session.execute(stmt)
-            await session.commit()
+        return task
 
-    async def get_all_tasks_from_category(self, category_id: int) -> List[Task]:
-        async with async_session() as session:
-            stmt = select(Task).where(Task.category_id == category_id)
+    async def set_tasks_status(self, task_ids: List[int], user_id: int, completed: bool) -> List[Task]:
+        async with session_scope() as session:
+            stmt = update(Task).where(
+                and_(Task.id.in_(task_ids), Task.user_id == user_id)
+            ).values(completed=completed).returning(Task)
             result = await session.execute(stmt)
             tasks = result.scalars().all()
 
         return tasks
 
+    async def move_tasks_to_category(self, category_id: int, new_category_id: int, user_id: int) -> None:
+        async with session_scope() as session:
+            stmt = update(Task).where(
+                and_(Task.category_id == category_id, Task.user_id == user_id)
+            ).values(category_id=new_category_id)
+            await session.execute(stmt)
+
+    async def delete_task(self, task_id: int, user_id: int) -> bool:
+        deleted_ids = await SyncRepository().delete_with_tombstones(Task, Task.id == task_id, Task.user_id == user_id)
+        return len(deleted_ids) > 0
+
+    async def delete_tasks(self, task_ids: List[int], user_id: int) -> List[int]:
+        return await SyncRepository().delete_with_tombstones(Task, Task.id.in_(task_ids), Task.user_id == user_id)
+
     async def uncompleted_all_user_tasks(self, user_id: int) -> None:
-        async with async_session() as session:
+        async with session_scope() as session:
             stmt = update(Task).where(Task.user_id == user_id).values(completed=False)
             await session.execute(stmt)
-            await session.commit()
 
     async def uncompleted_all_tasks(self) -> None:
-        async with async_session() as session:
+        async with session_scope() as session:
             stmt = update(Task).values(completed=False)
             await session.execute(stmt)
-            await session.commit()
 
     async def delete_all_user_tasks(self, user_id: int) -> None:
-        async with async_session() as session:
-            stmt = delete(Task).where(Task.user_id == user_id)
-            await session.execute(stmt)
-            await session.commit()
+        await SyncRepository().delete_with_tombstones(Task, Task.user_id == user_id)
 
     async def delete_all_tasks(self) -> None:
-        async with async_session() as session:
-            stmt = delete(Task)
-            await session.execute(stmt)
-            await session.commit()
+        await SyncRepository().delete_with_tombstones(Task)
@@ -1,25 +1,112 @@
-from typing import Annotated, List
+from typing import Annotated, List, Optional
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Query, Request, Response
 
-from src.tasks.schemas import TaskResponse, TaskCreate, TaskEdit, SuccessfulResponse
+from config_data.config import Config, load_config
+from src.categories.exceptions import NotFoundException as CategoryNotFoundException
+from src.tasks.exceptions import NotFoundException as TaskNotFoundException
+from src.fieldsets import FieldSet, FieldSetQuery, dump_fields
+from src.tasks.schemas import TaskResponse, TaskCreate, TaskEdit, SuccessfulResponse, TaskFilters, TaskBatchCreate, \
+    TaskBatchStatus, TaskBatchDelete, TaskBatchResult, TaskPartialResponse, TaskStatsResponse
 from src.tasks.services import TaskService
 
-from src.users.models import User
+from src.users.schemas import UserPrincipal
+from src.users.data_versions import check_not_modified
 from src.users.services import UserService
 
+settings: Config = load_config(".env")
+pagination = settings.pagination
+
 router = APIRouter(tags=["tasks"], prefix="/tasks")
 
 
-@router.get("/", response_model=List[TaskResponse])
-async def get_all_tasks(current_user: Annotated[User, Depends(UserService().get_current_user)]) -> List[TaskResponse]:
-    tasks = await TaskService().get_all_user_tasks(current_user.id)
-    return list(map(lambda x: TaskResponse(**x.to_dict()), tasks))
+# Tasks ordered by (date, id). When there are more, the X-Next-Cursor header holds the
+# cursor of the next page. Answers 304 while the user's data version matches If-None-Match
+@router.get("/", response_model=List[TaskPartialResponse], response_model_exclude_unset=True)
+async def get_all_tasks(
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
+        request: Request,
+        response: Response,
+        filters: Annotated[TaskFilters, Depends()],
+        fieldset: Annotated[FieldSet, Depends(FieldSetQuery(TaskPartialResponse))],
+        cursor: Optional[str] = None,
+        limit: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = pagination.DEFAULT_PAGE_SIZE
+) -> List[TaskPartialResponse]:
+    await check_not_modified(request, response, current_user.id)
+    tasks, next_cursor = await TaskService().get_user_tasks_page(current_user.id, filters, cursor, limit, fieldset)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [TaskPartialResponse(**dump_fields(task, fieldset.fields, fieldset.include)) for task in tasks]
+
+
+# Tasks matching the search query, best matches first. Paginated like the task list
+@router.get("/search", response_model=List[TaskResponse])
+async def search_tasks(
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
+        request: Request,
+        response: Response,
+        q: Annotated[str, Query(min_length=1, max_length=200)],
+        cursor: Optional[str] = None,
+        limit: Annotated[int, Query(ge=1, le=pagination.MAX_PAGE_SIZE)] = pagination.DEFAULT_PAGE_SIZE
+) -> List[TaskResponse]:
+    await check_not_modified(request, response, current_user.id)
+    tasks, next_cursor = await TaskService().search_user_tasks(current_user.id, q, cursor, limit)
+    if next_cursor is not None:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [TaskResponse(**task.to_dict()) for task in tasks]
+
+
+# Counts of the user's tasks, overdue and due today count unfinished tasks dated before or on today
+@router.get("/stats", response_model=TaskStatsResponse)
+async def get_task_stats(
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)]
+) -> TaskStatsResponse:
+    return await TaskService().get_user_task_stats(current_user.id)
+
+
+# Batch endpoints run in one transaction and answer with one result per item, in request order
+@router.post("/batch", response_model=List[TaskBatchResult])
+async def create_tasks(
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
+        batch: TaskBatchCreate
+) -> List[TaskBatchResult]:
+    tasks = await TaskService().create_tasks(batch.tasks, current_user)
+    return [
+        TaskBatchResult(id=task.id, success=True, task=TaskResponse(**task.to_dict())) if task is not None
+        else TaskBatchResult(success=False, detail=CategoryNotFoundException.detail)
+        for task in tasks
+    ]
+
+
+@router.patch("/batch/status", response_model=List[TaskBatchResult])
+async def change_tasks_status(
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
+        batch: TaskBatchStatus
+) -> List[TaskBatchResult]:
+    tasks = await TaskService().set_tasks_status(batch.ids, current_user.id, batch.completed)
+    return [
+        TaskBatchResult(id=task_id, success=True, task=TaskResponse(**task.to_dict())) if task is not None
+        else TaskBatchResult(id=task_id, success=False, detail=TaskNotFoundException.detail)
+        for task_id, task in zip(batch.ids, tasks)
+    ]
+
+
+@router.delete("/batch", response_model=List[TaskBatchResult])
+async def delete_tasks(
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
+        batch: TaskBatchDelete
+) -> List[TaskBatchResult]:
+    deleted = await TaskService().delete_tasks(batch.ids, current_user.id)
+    return [
+        TaskBatchResult(id=task_id, success=True) if is_deleted
+        else TaskBatchResult(id=task_id, success=False, detail=TaskNotFoundException.detail)
+        for task_id, is_deleted in zip(batch.ids, deleted)
+    ]
 
 
 @router.get("/{task_id}", response_model=TaskResponse)
 async def get_task(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],  # noqa
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],  # noqa
         task_id: int
 ) -> TaskResponse:
     task = await TaskService().get_task_by_id(task_id, current_user.id)
@@ -28,7 +115,7 @@ async def get_task(
 
 @router.post("/", response_model=TaskResponse)
 async def create_task(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         new_task: TaskCreate
 ) -> TaskResponse:
     task = await TaskService().create_task(new_task, current_user)
@@ -37,7 +124,7 @@ async def create_task(
 
 @router.put("/{task_id}", response_model=TaskResponse)
 async def edit_task(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         task_id: int,
         edited_task: TaskEdit
 ) -> TaskResponse:
@@ -47,7 +134,7 @@ async def edit_task(
 
 @router.put("/{task_id}/change_status", response_model=TaskResponse)
 async def change_task_status(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         task_id: int
 ) -> TaskResponse:
     upd_task = await TaskService().change_task_status(task_id, current_user.id)
@@ -56,7 +143,7 @@ async def change_task_status(
 
 @router.delete("/{task_id}", response_model=SuccessfulResponse)
 async def delete_task(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         task_id: int
 ) -> SuccessfulResponse:
     await TaskService().delete_task(task_id, current_user.id)
@@ -1,6 +1,6 @@
 import datetime
-from typing import Annotated
-from pydantic import BaseModel, Field
+from typing import Annotated, List, Optional
+from pydantic import BaseModel, BeforeValidator, Field
 
 from src.tasks.models import Priority
 
@@ -33,3 +33,66 @@ class TaskResponse(BaseModel):
     completed: bool
     category_id: int
     date: datetime.date
+
+
+# Response of a sparse fieldset, fields that weren't asked for are left unset
+class TaskPartialResponse(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    description: Optional[str] = None
+    priority: Optional[Priority] = None
+    completed: Optional[bool] = None
+    category_id: Optional[int] = None
+    date: Optional[datetime.date] = None
+
+
+# Query parameters arrive as strings, priorities are integers
+PriorityQuery = Annotated[Priority, BeforeValidator(lambda value: int(value) if str(value).isdigit() else value)]
+
+
+class TaskFilters(BaseModel):
+    completed: Optional[bool] = None
+    priority: Optional[PriorityQuery] = None
+    category_id: Optional[int] = None
+    date_from: Optional[datetime.date] = None
+    date_to: Optional[datetime.date] = None
+
+
+class TaskBatchCreate(BaseModel):
+    tasks: Annotated[List[TaskCreate], Field(min_length=1, max_length=500)]
+
+
+class TaskBatchStatus(BaseModel):
+    ids: Annotated[List[int], Field(min_length=1, max_length=500)]
+    completed: bool
+
+
+class TaskBatchDelete(BaseModel):
+    ids: Annotated[List[int], Field(min_length=1, max_length=500)]
+
+
+class TaskBatchResult(BaseModel):
+    id: Optional[int] = None
+    success: bool
+    detail: Optional[str] = None
+    task: Optional[TaskResponse] = None
+
+
+class PriorityCount(BaseModel):
+    priority: Priority
+    count: int
+
+
+class CategoryCount(BaseModel):
+    category_id: int
+    count: int
+
+
+class TaskStatsResponse(BaseModel):
+    total: int
+    completed: int
+    uncompleted: int
+    overdue: int
+    due_today: int
+    by_priority: List[PriorityCount]
+    by_category: List[CategoryCount]
@@ -1,26 +1,62 @@
-from typing import List
+import datetime
+from collections import Counter
+from typing import List, Optional, Tuple
 
-from src.categories.exceptions import NotFoundException as CategoryNotFoundException
-from src.categories.models import Category
-from src.tasks.models import Task
+from src.tasks.models import Task, Priority
 from src.tasks.repositories import TaskRepository
-from src.tasks.schemas import TaskCreate, TaskEdit
-from src.tasks.exceptions import NotFoundException as TaskNotFoundException
+from src.tasks.schemas import TaskCreate, TaskEdit, TaskFilters, TaskStatsResponse, PriorityCount, CategoryCount
+from src.tasks.exceptions import NotFoundException as TaskNotFoundException, InvalidCursorException
 
+from config_data.config import Config, load_config
 from src.categories.services import CategoryService
-from src.users.models import User
+from src.database import session_scope
+from src.fieldsets import FieldSet
+from src.users.data_versions import bump_data_version, bump_all_data_versions, get_data_version
+from src.users.schemas import UserPrincipal
+from utils.cache import TTLCache
+from utils.cursor import encode_cursor, decode_cursor
+
+settings: Config = load_config(".env")
+
+# Keyed by the user's data version, which every task write bumps, and the day the
+# overdue and due today counts are relative to
+task_stats_cache = TTLCache(maxsize=settings.cache.USER_CACHE_SIZE, ttl=settings.cache.TASK_STATS_CACHE_TTL)
 
 
 class TaskService:
     repository = TaskRepository()
 
-    async def create_task(self, task_create: TaskCreate, user: User) -> Task:
+    async def create_task(self, task_create: TaskCreate, user: UserPrincipal) -> Task:
         await CategoryService().get_category_by_id(task_create.category_id, user)
-        return await self.repository.create_task(task_create, user.id)
+        task = await self.repository.create_task(task_create, user.id)
+        await bump_data_version(user.id)
+
+        return task
+
+    async def edit_task(self, task_edit: TaskEdit, task_id: int, user: UserPrincipal) -> Task:
+        task = await self.repository.edit_task(task_id, user.id, task_edit)
+        if task is None:
+            # Tell which of the two was missing only when the update didn't match
+            await CategoryService().get_category_by_id(task_edit.category_id, user)
+            raise TaskNotFoundException()
+
+        await bump_data_version(user.id)
+        return task
+
+    async def create_tasks(self, tasks: List[TaskCreate], user: UserPrincipal) -> List[Optional[Task]]:
+        # None for the tasks whose category isn't one of the user's
+        async with session_scope():
+            category_ids = {task.category_id for task in tasks}
+            owned_ids = await CategoryService().get_user_category_ids(category_ids, user)
+            created_tasks = await self.repository.create_tasks(
+                [task for task in tasks if task.category_id in owned_ids], user.id
+            )
+            if created_tasks:
+                await bump_data_version(user.id)
 
-    async def edit_task(self, task_edit: TaskEdit, task_id: int, user: User) -> Task:
-        await CategoryService().get_category_by_id(task_edit.category_id, user)
-        return await self.repository.edit_task(await self.get_task_by_id(task_id, user.id), task_edit)
+        created = iter(created_tasks)
+
+        return [next(created) if task.category_id in owned_ids else None for task in tasks]
 
     async def get_task_by_id(self, task_id: int, user_id: int) -> Task:
         task = await self.repository.get_task_by_id(task_id)
@@ -29,35 +65,125 @@ class TaskService:
 
         return task
 
-    async def get_all_user_tasks(self, user_id: int) -> List[Task]:
-        return await self.repository.get_all_user_tasks(user_id)
+    async def get_user_tasks_page(
+            self,
+            user_id: int,
+            filters: TaskFilters,
+            cursor: Optional[str],
+            limit: int,
+            fieldset: Optional[FieldSet] = None
+    ) -> Tuple[List[Task], Optional[str]]:
+        after = None
+        if cursor is not None:
+            try:
+                values = decode_cursor(cursor)
+                after = (datetime.date.fromisoformat(values["date"]), int(values["id"]))
+            except (ValueError, KeyError, TypeError):
+                raise InvalidCursorException()
+
+        # One extra row tells whether there is a next page
+        tasks = await self.repository.get_user_tasks_page(user_id, filters, after, limit + 1, fieldset)
+        if len(tasks) <= limit:
+            return tasks, None
+
+        tasks = tasks[:limit]
+        return tasks, encode_cursor({"date": tasks[-1].date.isoformat(), "id": tasks[-1].id})
+
+    async def search_user_tasks(
+            self,
+            user_id: int,
+            query: str,
+            cursor: Optional[str],
+            limit: int
+    ) -> Tuple[List[Task], Optional[str]]:
+        after = None
+        if cursor is not None:
+            try:
+                values = decode_cursor(cursor)
+                after = (float(values["rank"]), int(values["id"]))
+            except (ValueError, KeyError, TypeError):
+                raise InvalidCursorException()
+
+        # One extra row tells whether there is a next page
+        results = await self.repository.search_user_tasks(user_id, query, after, limit + 1)
+        tasks = [task for task, _ in results[:limit]]
+        if len(results) <= limit:
+            return tasks, None
+
+        # Ranks are float4 values, which survive the round trip through JSON exactly
+        rank = results[limit - 1][1]
+        return tasks, encode_cursor({"rank": rank, "id": tasks[-1].id})
+
+    async def get_user_task_stats(self, user_id: int) -> TaskStatsResponse:
+        # The version is read before the statistics, so they are never older than their key
+        key = (user_id, await get_data_version(user_id), datetime.date.today())
+        stats = task_stats_cache.get(key)
+        if stats is not None:
+            return stats
+
+        rows = await self.repository.get_user_task_stats(user_id, key[2])
+        by_priority, by_category = Counter(), Counter()
+        for row in rows:
+            by_priority[row.priority] += row.count
+            by_category[row.category_id] += row.count
+
+        total = sum(row.count for row in rows)
+        completed = sum(row.count for row in rows if row.completed)
+        stats = TaskStatsResponse(
+            total=total,
+            completed=completed,
+            uncompleted=total - completed,
+            overdue=sum(row.overdue for row in rows),
+            due_today=sum(row.due_today for row in rows),
+            by_priority=[PriorityCount(priority=priority, count=by_priority[priority]) for priority in Priority],
+            by_category=[
+                CategoryCount(category_id=category_id, count=count)
+                for category_id, count in sorted(by_category.items())
+            ],
+        )
+        task_stats_cache.set(key, stats)
+        return stats
 
-    async def get_all_tasks_from_category(self, category: Category, user: User) -> List[Task]:
-        if category is None or category.user_id != user.id:
-            raise CategoryNotFoundException()
+    async def change_task_status(self, task_id: int, user_id: int) -> Task:
+        task = await self.repository.change_task_status(task_id, user_id)
+        if task is None:
+            raise TaskNotFoundException()
+
+        await bump_data_version(user_id)
+        return task
 
-        return await self.repository.get_all_tasks_from_category(category.id)
+    async def set_tasks_status(self, task_ids: List[int], user_id: int, completed: bool) -> List[Optional[Task]]:
+        tasks = {task.id: task for task in await self.repository.set_tasks_status(task_ids, user_id, completed)}
+        if tasks:
+            await bump_data_version(user_id)
 
-    async def set_base_category_for_task(self, task: Task, user: User):
-        if task.user_id != user.id:
+        return [tasks.get(task_id) for task_id in task_ids]
+
+    async def delete_task(self, task_id: int, user_id: int) -> None:
+        if not await self.repository.delete_task(task_id, user_id):
             raise TaskNotFoundException()
 
-        return await self.repository.set_base_category_for_task(task, user.base_category_id)
+        await bump_data_version(user_id)
 
-    async def change_task_status(self, task_id: int, user_id: int) -> Task:
-        return await self.repository.change_task_status(await self.get_task_by_id(task_id, user_id))
+    async def delete_tasks(self, task_ids: List[int], user_id: int) -> List[bool]:
+        deleted_ids = set(await self.repository.delete_tasks(task_ids, user_id))
+        if deleted_ids:
+            await bump_data_version(user_id)
 
-    async def delete_task(self, task_id: int, user_id: int) -> None:
-        return await self.repository.delete_task(await self.get_task_by_id(task_id, user_id))
+        return [task_id in deleted_ids for task_id in task_ids]
 
     async def uncompleted_all_user_tasks(self, user_id: int) -> None:
         await self.repository.uncompleted_all_user_tasks(user_id)
+        await bump_data_version(user_id)
 
     async def uncompleted_all_tasks(self) -> None:
         await self.repository.uncompleted_all_tasks()
+        await bump_all_data_versions()
 
     async def delete_all_user_tasks(self, user_id: int) -> None:
         await self.repository.delete_all_user_tasks(user_id)
+        await bump_data_version(user_id)
 
     async def delete_all_tasks(self) -> None:
         await self.repository.delete_all_tasks()
+        await bump_all_data_versions()
@@ -2,24 +2,27 @@ from typing import Annotated, List
 
 from fastapi import APIRouter, Depends
 
-from src.users.models import User
-from src.users.schemas import UserResponse, SuccessfulResponse
+from src.fieldsets import FieldSet, FieldSetQuery, dump_fields
+from src.users.schemas import UserResponse, SuccessfulResponse, UserPrincipal, CacheStats, PoolStats, UserPartialResponse
 from src.users.services import UserService
 
 router = APIRouter(tags=["admin"], prefix="/admin")
 
 
-@router.get("/users", response_model=List[UserResponse])
+@router.get("/users", response_model=List[UserPartialResponse], response_model_exclude_unset=True)
 async def get_all_users(
-        current_admin: Annotated[User, Depends(UserService().get_current_admin_user)],  # noqa
-) -> List[UserResponse]:
-    users = await UserService().get_all_users()
-    return list(map(lambda x: UserResponse(**x.to_dict()), users))
+        current_admin: Annotated[UserPrincipal, Depends(UserService().get_current_admin_user)],  # noqa
+        fieldset: Annotated[FieldSet, Depends(
+            FieldSetQuery(UserPartialResponse, relations=("categories", "categories.tasks", "tasks"))
+        )]
+) -> List[UserPartialResponse]:
+    users = await UserService().get_all_users(fieldset)
+    return [UserPartialResponse(**dump_fields(user, fieldset.fields, fieldset.include)) for user in users]
 
 
 @router.get("/users/{user_id}", response_model=UserResponse)
 async def get_user_by_id(
-        current_admin: Annotated[User, Depends(UserService().get_current_admin_user)],  # noqa
+        current_admin: Annotated[UserPrincipal, Depends(UserService().get_current_admin_user)],  # noqa
         user_id: int
 ) -> UserResponse:
     user = await UserService().get_user_by_id(user_id)
@@ -28,7 +31,7 @@ async def get_user_by_id(
 
 @router.put("/users/{user_id}/change_admin_status")
 async def change_admin_status(
-        current_admin: Annotated[User, Depends(UserService().get_current_admin_user)],  # noqa
+        current_admin: Annotated[UserPrincipal, Depends(UserService().get_current_admin_user)],  # noqa
         user_id: int
 ) -> UserResponse:
     user = await UserService().change_admin_status(user_id)
@@ -37,7 +40,7 @@ async def change_admin_status(
 
 @router.put("/users/{user_id}/change_verified_status")
 async def change_verified_status(
-        current_admin: Annotated[User, Depends(UserService().get_current_admin_user)],  # noqa
+        current_admin: Annotated[UserPrincipal, Depends(UserService().get_current_admin_user)],  # noqa
         user_id: int
 ) -> UserResponse:
     user = await UserService().change_verified_status(user_id)
@@ -46,7 +49,7 @@ async def change_verified_status(
 
 @router.put("/users/{user_id}/change_active_status")
 async def change_active_status(
-        current_admin: Annotated[User, Depends(UserService().get_current_admin_user)],  # noqa
+        current_admin: Annotated[UserPrincipal, Depends(UserService().get_current_admin_user)],  # noqa
         user_id: int
 ) -> UserResponse:
     user = await UserService().change_active_status(user_id)
@@ -55,8 +58,22 @@ async def change_active_status(
 
 @router.delete("/users/{user_id}", response_model=SuccessfulResponse)
 async def delete_user(
-        current_admin: Annotated[User, Depends(UserService().get_current_admin_user)],  # noqa
+        current_admin: Annotated[UserPrincipal, Depends(UserService().get_current_admin_user)],  # noqa
         user_id: int
 ) -> SuccessfulResponse:
     await UserService().delete_user_by_id(user_id)
     return SuccessfulResponse()
+
+
+@router.get("/cache/users", response_model=CacheStats)
+async def get_user_cache_stats(
+        current_admin: Annotated[UserPrincipal, Depends(UserService().get_current_admin_user)],  # noqa
+) -> CacheStats:
+    return UserService().get_user_cache_stats()
+
+
+@router.get("/db/pool", response_model=PoolStats)
+async def get_pool_stats(
+        current_admin: Annotated[UserPrincipal, Depends(UserService().get_current_admin_user)],  # noqa
+) -> PoolStats:
+    return UserService().get_pool_stats()
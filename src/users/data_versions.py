@@ -0,0 +1,71 @@
+import hashlib
+from typing import Optional
+
+from fastapi import Request, Response
+
+from config_data.config import Config, load_config
+from src.database import after_commit
+from src.users.exceptions import NotModifiedException
+from src.users.repositories import UserRepository
+from utils.cache import TTLCache
+
+settings: Config = load_config(".env")
+
+# Every change to a user's tasks, categories or profile bumps the user's data version, so
+# list responses can be tagged with it and revalidated without reading the lists.
+# Versions are read where the lists are (the replica, if there is one), so a tag never
+# claims data newer than the response it comes with.
+data_version_cache = TTLCache(maxsize=settings.cache.USER_CACHE_SIZE, ttl=settings.cache.DATA_VERSION_CACHE_TTL)
+
+
+def _invalidate(user_id: Optional[int]) -> None:
+    if user_id is None:
+        data_version_cache.clear()
+    else:
+        data_version_cache.invalidate(user_id)
+
+
+def _invalidate_after_commit(user_id: Optional[int]) -> None:
+    # Again after commit, so a concurrent lookup can't cache the version from before the bump
+    _invalidate(user_id)
+    after_commit(lambda: _invalidate(user_id))
+
+
+async def get_data_version(user_id: int) -> int:
+    generation = data_version_cache.generation
+    version = data_version_cache.get(user_id)
+    if version is None:
+        version = await UserRepository().get_data_version(user_id) or 0
+        data_version_cache.set(user_id, version, generation)
+
+    return version
+
+
+async def bump_data_version(user_id: int) -> None:
+    await UserRepository().bump_data_version(user_id)
+    _invalidate_after_commit(user_id)
+
+
+async def bump_all_data_versions() -> None:
+    await UserRepository().bump_all_data_versions()
+    _invalidate_after_commit(None)
+
+
+def _representation_digest(request: Request) -> str:
+    # Every path and query (page, filters, fields) is a representation of its own
+    query = sorted(request.query_params.multi_items())
+    return hashlib.sha256(repr((request.url.path, query)).encode()).hexdigest()[:16]
+
+
+async def check_not_modified(request: Request, response: Response, user_id: int) -> None:
+    etag = f'"{user_id}-{await get_data_version(user_id)}-{_representation_digest(request)}"'
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None:
+        # If-None-Match uses the weak comparison
+        tags = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+        if etag in tags or "*" in tags:
+            raise NotModifiedException(etag)
+
+    response.headers["ETag"] = etag
+    # Clients may keep the response, but have to revalidate it every time
+    response.headers["Cache-Control"] = "private, no-cache"
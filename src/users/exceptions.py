@@ -76,3 +76,27 @@ class IncorrectVerifyCodeException(HTTPException):
 
     def __init__(self):
         super().__init__(status_code=self.status_code, detail=self.detail)
+
+
+class TooManyAttemptsException(HTTPException):
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+    detail = "Too many attempts, request a new verification code"
+
+    def __init__(self):
+        super().__init__(status_code=self.status_code, detail=self.detail)
+
+
+class ServiceBusyException(HTTPException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    detail = "Service is busy, try again later"
+    headers = {"Retry-After": "1"}
+
+    def __init__(self):
+        super().__init__(status_code=self.status_code, detail=self.detail, headers=self.headers)
+
+
+class NotModifiedException(HTTPException):
+    status_code = status.HTTP_304_NOT_MODIFIED
+
+    def __init__(self, etag: str):
+        super().__init__(status_code=self.status_code, headers={"ETag": etag})
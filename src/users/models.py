@@ -3,7 +3,7 @@ import datetime
 from enum import Enum
 from typing import Dict, Any, List
 
-from sqlalchemy import func, String
+from sqlalchemy import func, BigInteger, String, Sequence
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from src.database import Base
@@ -17,6 +17,10 @@ class Gender(Enum):
     female = "female"
 
 
+# Source of public ids, see src/id_generator.py
+user_id_sequence = Sequence("users_public_id_seq", start=0, minvalue=0, metadata=Base.metadata)
+
+
 class User(Base):
     __tablename__ = "users"
 
@@ -33,6 +37,8 @@ class User(Base):
     is_active: Mapped[bool] = mapped_column(default=True, nullable=False)
     password_hash: Mapped[bytes] = mapped_column(nullable=False)
     created_at: Mapped[datetime.datetime] = mapped_column(default=func.now(), nullable=False)
+    # Bumped by every change to the user's data, see src/users/data_versions.py
+    data_version: Mapped[int] = mapped_column(BigInteger, default=0, server_default="0", nullable=False)
 
     categories: Mapped[List["Category"]] = relationship(back_populates="user", uselist=True, lazy="selectin",
                                                         cascade="all, delete-orphan")
@@ -63,3 +69,15 @@ class VerifyCode(Base):
     id: Mapped[int] = mapped_column(primary_key=True)
     email: Mapped[str] = mapped_column(String(50), unique=True, nullable=False)
     code: Mapped[int] = mapped_column(nullable=False)
+    attempts: Mapped[int] = mapped_column(default=0, server_default="0", nullable=False)
+    expires_at: Mapped[datetime.datetime] = mapped_column(default=func.now(), nullable=False)
+
+
+class RevokedToken(Base):
+    __tablename__ = "revoked_tokens"
+
+    id: Mapped[int] = mapped_column(primary_key=True)
+    jti: Mapped[str] = mapped_column(String(32), unique=True, nullable=True)
+    short_name: Mapped[str] = mapped_column(String(20), nullable=True)
+    revoked_at: Mapped[datetime.datetime] = mapped_column(nullable=False)
+    expires_at: Mapped[datetime.datetime] = mapped_column(nullable=False)
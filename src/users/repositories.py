@@ -1,197 +1,343 @@
-import random
+import datetime
 from typing import Optional, List
 
-from sqlalchemy import insert, select, delete, update
+from sqlalchemy import select, delete, update, and_, not_
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import InstrumentedAttribute, raiseload, selectinload
 
-from src.database import async_session
+from src.database import session_scope, read_session_scope, end_transaction, after_commit
+from src.fieldsets import FieldSet, load_fields
+from src.id_generator import create_id_generator
 from config_data.config import Config, load_config
 from utils import auth_settings
+from utils.cache import TTLCache
 
-from src.users.models import User, VerifyCode
-from src.users.schemas import UserCreate, UserEdit
+from src.categories.models import Category
+from src.users.models import User, VerifyCode, RevokedToken, user_id_sequence
+from src.users.schemas import UserCreate, UserEdit, UserPrincipal
 
 settings: Config = load_config(".env")
-global_vars = settings.variablesData
+
+id_generator = create_id_generator(user_id_sequence)
+user_cache = TTLCache(maxsize=settings.cache.USER_CACHE_SIZE, ttl=settings.cache.USER_CACHE_TTL)
+
+
+def invalidate_cached_user(short_name: str) -> None:
+    # Again after commit, so a concurrent lookup can't cache the row as it was before it
+    user_cache.invalidate(short_name)
+    after_commit(lambda: user_cache.invalidate(short_name))
 
 
 class UserRepository:
     async def generate_id(self) -> int:
-        unique_id = random.randint(global_vars.MIN_ID, global_vars.MAX_ID)
-        while await self.get_user_by_id(unique_id):
-            unique_id = random.randint(global_vars.MIN_ID, global_vars.MAX_ID)
-
-        return unique_id
+        return await id_generator.next_id()
+
+    async def save_verify_code(self, email: str, code: int, expires_at: datetime.datetime) -> None:
+        async with session_scope() as session:
+            stmt = insert(VerifyCode).values(email=email, code=code, expires_at=expires_at)
+            stmt = stmt.on_conflict_do_update(
+                index_elements=[VerifyCode.email],
+                set_={"code": stmt.excluded.code, "expires_at": stmt.excluded.expires_at, "attempts": 0}
+            )
+            await session.execute(stmt)
 
-    async def create_verify_code(self, email: str, code: int) -> None:
-        async with async_session() as session:
-            stmt = insert(VerifyCode).values(email=email, code=code)
+    async def pop_verify_code(self, email: str, code: int, max_attempts: int) -> bool:
+        async with session_scope() as session:
+            stmt = delete(VerifyCode).where(
+                and_(
+                    VerifyCode.email == email,
+                    VerifyCode.code == code,
+                    VerifyCode.attempts < max_attempts,
+                    VerifyCode.expires_at > datetime.datetime.utcnow()
+                )
+            ).returning(VerifyCode.id)
+            result = await session.execute(stmt)
+            deleted = result.first() is not None
+
+        return deleted
+
+    async def count_verify_code_attempt(self, email: str) -> Optional[int]:
+        # Failed attempts including this one, None without a code
+        async with session_scope() as session:
+            stmt = update(VerifyCode).where(
+                and_(VerifyCode.email == email, VerifyCode.expires_at > datetime.datetime.utcnow())
+            ).values(attempts=VerifyCode.attempts + 1).returning(VerifyCode.attempts)
+            result = await session.execute(stmt)
+
+            return result.scalar()
+
+    async def delete_expired_verify_codes(self) -> None:
+        async with session_scope() as session:
+            stmt = delete(VerifyCode).where(VerifyCode.expires_at <= datetime.datetime.utcnow())
             await session.execute(stmt)
-            await session.commit()
 
-    async def update_verify_code(self, email: str, code: int) -> None:
-        async with async_session() as session:
-            stmt = update(VerifyCode).where(VerifyCode.email == email).values(code=code)
+    async def create_revoked_token(
+            self,
+            expires_at: datetime.datetime,
+            jti: str | None = None,
+            short_name: str | None = None
+    ) -> datetime.datetime:
+        revoked_at = datetime.datetime.utcnow()
+        async with session_scope() as session:
+            stmt = insert(RevokedToken).values(
+                jti=jti,
+                short_name=short_name,
+                revoked_at=revoked_at,
+                expires_at=expires_at
+            ).on_conflict_do_nothing(index_elements=[RevokedToken.jti])
             await session.execute(stmt)
-            await session.commit()
 
-    async def get_verify_code_by_email(self, email: str) -> VerifyCode:
-        async with async_session() as session:
-            query = select(VerifyCode).where(VerifyCode.email == email)
+        return revoked_at
+
+    async def get_active_revoked_tokens(self) -> List[RevokedToken]:
+        async with session_scope() as session:
+            query = select(RevokedToken).where(RevokedToken.expires_at > datetime.datetime.utcnow())
             result = await session.execute(query)
-            verify_code = result.scalars().first()
+            revoked_tokens = result.scalars().all()
 
-            return verify_code
+        return revoked_tokens
 
-    async def delete_verify_code_by_id(self, code_id: int) -> None:
-        async with async_session() as session:
-            stmt = delete(VerifyCode).where(VerifyCode.id == code_id)
+    async def is_token_revoked(self, jti: str) -> bool:
+        async with session_scope() as session:
+            query = select(RevokedToken.id).where(RevokedToken.jti == jti)
+            result = await session.execute(query)
+
+            return result.first() is not None
+
+    async def delete_expired_revoked_tokens(self) -> None:
+        async with session_scope() as session:
+            stmt = delete(RevokedToken).where(RevokedToken.expires_at <= datetime.datetime.utcnow())
             await session.execute(stmt)
-            await session.commit()
 
     async def create_user(self, new_user: UserCreate) -> User:
         password = new_user.password
         user_dc = new_user.dict(exclude={"password"})
-        user_dc["password_hash"] = auth_settings.hash_password(password)
-        user_dc["id"] = await self.generate_id()
+        await end_transaction()
+        user_dc["password_hash"] = await auth_settings.hash_password_async(password)
 
-        async with async_session() as session:
-            stmt = insert(User).values(**user_dc)
-            await session.execute(stmt)
-            await session.commit()
-
-            query = select(User).where(User.id == user_dc["id"])
-            result = await session.execute(query)
-            user = result.scalars().first()
+        async with session_scope() as session:
+            user: Optional[User] = None
+            while user is None:
+                user_dc["id"] = await self.generate_id()
+                stmt = insert(User).values(**user_dc).on_conflict_do_nothing(index_elements=[User.id]).returning(User)
+                result = await session.execute(stmt)
+                user = result.scalars().first()
 
         return user
 
-    async def edit_password(self, user: User, password: str) -> None:
-        async with async_session() as session:
-            new_hashed_password = auth_settings.hash_password(password)
+    async def edit_password(self, user: User | UserPrincipal, password: str) -> None:
+        await end_transaction()
+        new_hashed_password = await auth_settings.hash_password_async(password)
+        async with session_scope() as session:
             stmt = update(User).where(User.id == user.id).values(password_hash=new_hashed_password)
             await session.execute(stmt)
-            await session.commit()
 
-    async def edit_info(self, user: User, user_edit: UserEdit) -> User:
-        async with async_session() as session:
-            stmt = update(User).where(User.id == user.id).values(**user_edit.dict())
+    async def replace_password_hash(self, user_id: int, old_password_hash: bytes, password_hash: bytes) -> None:
+        async with session_scope() as session:
+            stmt = update(User).where(
+                and_(User.id == user_id, User.password_hash == old_password_hash)
+            ).values(password_hash=password_hash)
             await session.execute(stmt)
-            await session.commit()
 
-        upd_user = await self.get_user_by_id(user.id)
+    async def edit_info(self, user: User | UserPrincipal, user_edit: UserEdit) -> User:
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user.id).values(**user_edit.dict()).returning(User)
+            result = await session.execute(stmt)
+            upd_user = result.scalars().one()
+        invalidate_cached_user(user.short_name)
+
         return upd_user
 
-    async def set_base_category_id(self, user: User, category_id: int) -> User:
-        async with async_session() as session:
-            stmt = update(User).where(User.id == user.id).values(base_category_id=category_id)
-            await session.execute(stmt)
-            await session.commit()
+    async def set_base_category_id(self, user: User | UserPrincipal, category_id: int) -> User:
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user.id).values(base_category_id=category_id).returning(User)
+            result = await session.execute(stmt)
+            upd_user = result.scalars().one()
+        invalidate_cached_user(user.short_name)
 
-        upd_user = await self.get_user_by_id(user.id)
         return upd_user
 
+    async def get_data_version(self, user_id: int) -> Optional[int]:
+        async with read_session_scope() as session:
+            query = select(User.data_version).where(User.id == user_id)
+            result = await session.execute(query)
+
+            return result.scalar()
+
+    async def bump_data_version(self, user_id: int) -> None:
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user_id).values(data_version=User.data_version + 1)
+            await session.execute(stmt)
+
+    async def bump_all_data_versions(self) -> None:
+        async with session_scope() as session:
+            stmt = update(User).values(data_version=User.data_version + 1)
+            await session.execute(stmt)
+
     async def get_user_by_email(self, email: str) -> Optional[User]:
-        async with async_session() as session:
+        async with session_scope() as session:
             query = select(User).where(User.email == email)
             result = await session.execute(query)
             user = result.scalars().first()
         return user
 
-    async def get_all_users(self) -> List[User]:
-        async with async_session() as session:
+    async def get_all_users(self, fieldset: Optional[FieldSet] = None) -> List[User]:
+        async with read_session_scope() as session:
             query = select(User)
+            if fieldset is not None:
+                categories = selectinload(User.categories)
+                query = query.options(
+                    load_fields(User, fieldset),
+                    selectinload(User.tasks) if "tasks" in fieldset.include else raiseload(User.tasks),
+                    raiseload(User.categories) if "categories" not in fieldset.include
+                    else categories.selectinload(Category.tasks) if "categories.tasks" in fieldset.include
+                    else categories.raiseload(Category.tasks)
+                )
             result = await session.execute(query)
             users = result.scalars().all()
 
             return users
 
     async def get_user_by_short_name(self, short_name: str) -> Optional[User]:
-        async with async_session() as session:
+        async with session_scope() as session:
             query = select(User).where(User.short_name == short_name)
             result = await session.execute(query)
             user = result.scalars().first()
 
         return user
 
-    async def save_avatar_name(self, file_name: str, user: User) -> Optional[User]:
-        async with async_session() as session:
-            stmt = update(User).where(User.id == user.id).values(avatar_path=file_name)
-            await session.execute(stmt)
-            await session.commit()
+    async def get_principal_by_short_name(self, short_name: str) -> Optional[UserPrincipal]:
+        principal = user_cache.get(short_name)
+        if principal is not None:
+            return principal
+
+        generation = user_cache.generation
+        async with session_scope() as session:
+            query = select(
+                User.id, User.short_name, User.email, User.base_category_id, User.is_admin, User.is_active
+            ).where(User.short_name == short_name)
+            result = await session.execute(query)
+            row = result.first()
+
+        if row is None:
+            return None
+
+        principal = UserPrincipal(**row._asdict())
+        user_cache.set(short_name, principal, generation=generation)
+        return principal
 
-            user = await self.get_user_by_id(user.id)
-            return user
+    async def save_avatar_name(self, file_name: str, user: User | UserPrincipal) -> Optional[User]:
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user.id).values(avatar_path=file_name).returning(User)
+            result = await session.execute(stmt)
+            upd_user = result.scalars().first()
+        invalidate_cached_user(user.short_name)
+
+        return upd_user
 
     async def change_admin_status(self, user: User) -> User:
-        async with async_session() as session:
-            stmt = update(User).where(User.id == user.id).values(is_admin=False if user.is_admin else True)
-            await session.execute(stmt)
-            await session.commit()
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user.id).values(is_admin=not_(User.is_admin)).returning(User)
+            result = await session.execute(stmt)
+            user: User = result.scalars().one()
+        invalidate_cached_user(user.short_name)
 
-            user: User = await self.get_user_by_id(user.id)
-            return user
+        return user
 
     async def change_verified_status(self, user: User) -> User:
-        async with async_session() as session:
-            stmt = update(User).where(User.id == user.id).values(is_verified=False if user.is_verified else True)
-            await session.execute(stmt)
-            await session.commit()
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user.id).values(is_verified=not_(User.is_verified)).returning(User)
+            result = await session.execute(stmt)
+            user: User = result.scalars().one()
+        invalidate_cached_user(user.short_name)
 
-            user: User = await self.get_user_by_id(user.id)
-            return user
+        return user
 
     async def change_active_status(self, user: User) -> User:
-        async with async_session() as session:
-            stmt = update(User).where(User.id == user.id).values(is_active=False if user.is_active else True)
-            await session.execute(stmt)
-            await session.commit()
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user.id).values(is_active=not_(User.is_active)).returning(User)
+            result = await session.execute(stmt)
+            user: User = result.scalars().one()
+        invalidate_cached_user(user.short_name)
+
+        return user
 
-            user: User = await self.get_user_by_id(user.id)
-            return user
+    async def toggle_non_admin_flag(self, user_id: int, flag: InstrumentedAttribute[bool]) -> Optional[User]:
+        # Admins are protected from admin actions, the check is part of the statement
+        async with session_scope() as session:
+            stmt = update(User).where(
+                and_(User.id == user_id, not_(User.is_admin))
+            ).values({flag: not_(flag)}).returning(User)
+            result = await session.execute(stmt)
+            user = result.scalars().first()
+
+        if user is not None:
+            invalidate_cached_user(user.short_name)
+        return user
 
     async def get_user_by_id(self, user_id: int) -> Optional[User]:
-        async with async_session() as session:
+        async with session_scope() as session:
             query = select(User).where(User.id == user_id)
             result = await session.execute(query)
             user = result.scalars().first()
 
         return user
 
-    async def delete_user(self, user: User) -> None:
-        async with async_session() as session:
+    async def delete_user(self, user: User | UserPrincipal) -> None:
+        async with session_scope() as session:
             stmt = delete(User).where(User.id == user.id)
             await session.execute(stmt)
-            await session.commit()
+        invalidate_cached_user(user.short_name)
 
     async def set_admin_status(self, user: User) -> User:
-        async with async_session() as session:
-            stmt = update(User).where(User.id == user.id).values(is_admin=True)
-            await session.execute(stmt)
-            await session.commit()
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user.id).values(is_admin=True).returning(User)
+            result = await session.execute(stmt)
+            user: User = result.scalars().one()
+        invalidate_cached_user(user.short_name)
 
-            user: User = await self.get_user_by_id(user.id)
-            return user
+        return user
 
     async def delete_user_by_id(self, user_id: int) -> None:
-        async with async_session() as session:
-            stmt = delete(User).where(User.id == user_id)
-            await session.execute(stmt)
-            await session.commit()
+        async with session_scope() as session:
+            stmt = delete(User).where(User.id == user_id).returning(User.short_name)
+            result = await session.execute(stmt)
+            short_names = result.scalars().all()
+
+        for short_name in short_names:
+            invalidate_cached_user(short_name)
+
+    async def delete_non_admin_user_by_id(self, user_id: int) -> bool:
+        async with session_scope() as session:
+            stmt = delete(User).where(and_(User.id == user_id, not_(User.is_admin))).returning(User.short_name)
+            result = await session.execute(stmt)
+            short_name = result.scalars().first()
+
+        if short_name is None:
+            return False
+
+        invalidate_cached_user(short_name)
+        return True
 
     async def remove_user_admin_status(self, user_id: int) -> None:
-        async with async_session() as session:
-            stmt = update(User).where(User.id == user_id).values(is_admin=False)
-            await session.execute(stmt)
-            await session.commit()
+        async with session_scope() as session:
+            stmt = update(User).where(User.id == user_id).values(is_admin=False).returning(User.short_name)
+            result = await session.execute(stmt)
+            short_names = result.scalars().all()
+
+        for short_name in short_names:
+            invalidate_cached_user(short_name)
 
     async def remove_admin_status_for_all(self) -> None:
-        async with async_session() as session:
+        async with session_scope() as session:
             stmt = update(User).values(is_admin=False)
             await session.execute(stmt)
-            await session.commit()
+        user_cache.clear()
+        after_commit(user_cache.clear)
 
     async def delete_all_users(self) -> None:
-        async with async_session() as session:
+        async with session_scope() as session:
             stmt = delete(User)
             await session.execute(stmt)
-            await session.commit()
+        user_cache.clear()
+        after_commit(user_cache.clear)
@@ -0,0 +1,107 @@
+import asyncio
+import datetime
+import time
+from typing import Dict, Set
+
+from config_data.config import Config, load_config
+from utils.bloom import BloomFilter
+
+from src.database import separate_session_scope
+from src.users.repositories import UserRepository
+
+settings: Config = load_config(".env")
+auth_config = settings.authJWT
+
+
+# Revoked token ids are stored in the DB and mirrored into a Bloom filter that is rebuilt
+# periodically, so the common "not revoked" answer needs no DB round trip. Revocations of
+# all tokens of a user are rare and kept in memory as is.
+class TokenRevocationList:
+    repository = UserRepository()
+
+    def __init__(self, refresh_seconds: int, error_rate: float, min_capacity: int = 1024):
+        self.refresh_seconds = refresh_seconds
+        self.error_rate = error_rate
+        self.min_capacity = min_capacity
+        self._bloom: BloomFilter | None = None
+        self._revoked_users: Dict[str, float] = {}
+        self._pending: Set[str] | None = None
+        self._lock = asyncio.Lock()
+
+    async def rebuild(self) -> None:
+        async with self._lock:
+            await self._rebuild()
+
+    async def _ensure_loaded(self) -> None:
+        async with self._lock:
+            if self._bloom is None:
+                await self._rebuild()
+
+    async def _rebuild(self) -> None:
+        self._pending = set()
+        try:
+            # The first check may load the list in the middle of a request, the cleanup must
+            # not become part of the request's transaction
+            async with separate_session_scope():
+                await self.repository.delete_expired_revoked_tokens()
+                revoked_tokens = await self.repository.get_active_revoked_tokens()
+        except BaseException:
+            self._pending = None
+            raise
+
+        jtis = [token.jti for token in revoked_tokens if token.jti is not None] + list(self._pending)
+        revoked_users: Dict[str, float] = {}
+        for token in revoked_tokens:
+            if token.short_name is not None:
+                revoked_at = token.revoked_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+                revoked_users[token.short_name] = max(revoked_users.get(token.short_name, 0), revoked_at)
+
+        # Keep local revocations that may not have been visible to the query yet
+        min_revoked_at = time.time() - self.refresh_seconds * 2
+        for short_name, revoked_at in self._revoked_users.items():
+            if revoked_at >= min_revoked_at:
+                revoked_users[short_name] = max(revoked_users.get(short_name, 0), revoked_at)
+
+        self._bloom = BloomFilter.from_items(jtis, max(len(jtis) * 2, self.min_capacity), self.error_rate)
+        self._revoked_users = revoked_users
+        self._pending = None
+
+    async def run_periodic_rebuild(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_seconds)
+            try:
+                await self.rebuild()
+            except Exception:  # noqa
+                # Keep serving from the previous filter until the next attempt
+                continue
+
+    async def revoke_token(self, jti: str, expires_at: datetime.datetime) -> None:
+        await self.repository.create_revoked_token(expires_at=expires_at, jti=jti)
+        if self._bloom is not None:
+            self._bloom.add(jti)
+        if self._pending is not None:
+            self._pending.add(jti)
+
+    async def revoke_user_tokens(self, short_name: str) -> None:
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(days=auth_config.refresh_token_expire_days)
+        revoked_at = await self.repository.create_revoked_token(expires_at=expires_at, short_name=short_name)
+        self._revoked_users[short_name] = revoked_at.replace(tzinfo=datetime.timezone.utc).timestamp()
+
+    async def is_revoked(self, payload: dict) -> bool:
+        if self._bloom is None:
+            await self._ensure_loaded()
+
+        revoked_at = self._revoked_users.get(payload.get("sub"))
+        if revoked_at is not None and payload.get("iat", 0) <= revoked_at:
+            return True
+
+        jti = payload.get("jti")
+        if jti is None or jti not in self._bloom:
+            return False
+        return await self.repository.is_token_revoked(jti)
+
+
+token_revocation_list = TokenRevocationList(
+    refresh_seconds=auth_config.revocation_refresh_seconds,
+    error_rate=auth_config.revocation_error_rate
+)
@@ -1,7 +1,7 @@
-from typing import List, Annotated
+from typing import List, Annotated, Optional
 from pydantic import BaseModel, Field
 
-from src.categories.schemas import CategoryResponse
+from src.categories.schemas import CategoryResponse, CategoryPartialResponse
 from src.tasks.schemas import TaskResponse
 from src.users.models import Gender
 
@@ -22,6 +22,15 @@ class TokenData(BaseModel):
     short_name: str | None = None
 
 
+class UserPrincipal(BaseModel):
+    id: int
+    short_name: str
+    email: str
+    base_category_id: int
+    is_admin: bool
+    is_active: bool
+
+
 class Token(BaseModel):
     access_token: str
     refresh_token: str | None = None
@@ -33,6 +42,26 @@ class RefreshToken(BaseModel):
     token_type: str = "Bearer"
 
 
+class Logout(BaseModel):
+    refresh_token: str | None = None
+
+
+class CacheStats(BaseModel):
+    size: int
+    maxsize: int
+    hits: int
+    misses: int
+    evictions: int
+
+
+class PoolStats(BaseModel):
+    size: int
+    checked_in: int
+    checked_out: int
+    overflow: int
+    max_overflow: int
+
+
 class UserCreate(BaseModel):
     name: Annotated[str, Field(min_length=2, max_length=50)]
     surname: Annotated[str, Field(min_length=2, max_length=50)]
@@ -62,3 +91,14 @@ class UserResponse(BaseModel):
     gender: Gender
     tasks: List[TaskResponse]
     categories: List[CategoryResponse]
+
+
+class UserPartialResponse(BaseModel):
+    id: Optional[int] = None
+    name: Optional[str] = None
+    surname: Optional[str] = None
+    short_name: Optional[str] = None
+    email: Optional[str] = None
+    gender: Optional[Gender] = None
+    tasks: Optional[List[TaskResponse]] = None
+    categories: Optional[List[CategoryPartialResponse]] = None
@@ -1,25 +1,34 @@
+import asyncio
 import os
-import smtplib
 import shutil
+import uuid
 from pathlib import Path
 
 import jwt
 
-from datetime import timedelta
-from typing import Optional, List
-from fastapi import Depends, UploadFile
+from datetime import datetime, timedelta
+from typing import Optional, List, NoReturn
+from email_validator import validate_email, EmailNotValidError
+from fastapi import Depends, UploadFile, BackgroundTasks
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 
 from config_data.config import Config, load_config
-from utils.auth_settings import validate_password, decode_jwt, encode_jwt
-from utils.email_sender import send_verification_code
+from utils.auth_settings import validate_password_async, hash_password_async, password_needs_rehash, decode_jwt, \
+    encode_jwt, PasswordHashingBusyError
+from utils.email_sender import send_verification_code, generate_verification_code
 
+from src.database import end_transaction, get_pool_stats
+from src.fieldsets import FieldSet
 from src.users.models import User
-from src.users.repositories import UserRepository
-from src.users.schemas import UserCreate, TokenData, UserEdit, UserLogin
+from src.users.repositories import UserRepository, user_cache
+from src.users.data_versions import bump_data_version, bump_all_data_versions
+from src.users.revocation import token_revocation_list
+from src.users.verify_codes import verify_code_store, VerifyCodeStatus
+from src.users.schemas import UserCreate, TokenData, UserEdit, UserLogin, UserPrincipal, CacheStats, \
+    PoolStats
 from src.users.exceptions import CredentialException, TokenTypeException, NotFoundException, AccessException, \
     EmailExistsException, ShortNameExistsException, IncorrectEmailAddressException, EmailSenderException, \
-    IncorrectVerifyCodeException
+    IncorrectVerifyCodeException, ServiceBusyException, TooManyAttemptsException
 
 from src.categories.models import Category
 
@@ -43,7 +52,7 @@ class UserService:
             expire_minutes: int = auth_config.access_token_expire_minutes,
             expire_timedelta: timedelta | None = None
     ) -> str:
-        jwt_payload = {TOKEN_TYPE_FIELD: token_type}
+        jwt_payload = {TOKEN_TYPE_FIELD: token_type, "jti": uuid.uuid4().hex}
         jwt_payload.update(token_data)
         token = encode_jwt(
             payload=jwt_payload,
@@ -53,37 +62,45 @@ class UserService:
         return token
 
     async def get_verify_code(self, email: str) -> None:
+        # Mail is sent in the background, a refused recipient is only logged there. Addresses
+        # that can't be delivered to at all are turned away here
+        try:
+            validate_email(email, check_deliverability=False)
+        except EmailNotValidError:
+            raise IncorrectEmailAddressException()
+
         potential_user = await self.repository.get_user_by_email(email)
         if potential_user is not None:
             raise EmailExistsException()
 
-        try:
-            # Добавить в продакшене
-            # code = send_verification_code(email)
-            code = 77777
-            potential_code = await self.repository.get_verify_code_by_email(email)
-            if potential_code is not None:
-                await self.repository.update_verify_code(email, code)
-            else:
-                await self.repository.create_verify_code(email, code)
-
-        except smtplib.SMTPRecipientsRefused as e:
-            raise IncorrectEmailAddressException()
-        except Exception as e:
-            raise EmailSenderException()
+        # Письма с кодом отправляются только в продакшене
+        is_production = settings.variablesData.MODE == "PROD"
+        code = generate_verification_code() if is_production else 77777
 
-    async def check_verify_code(self, email: str, code: int) -> bool:
-        verify_code = await self.repository.get_verify_code_by_email(email)
-        if verify_code is None:
-            raise IncorrectEmailAddressException()
+        if is_production:
+            # Queued before the code is stored, so a full queue leaves no code behind
+            try:
+                send_verification_code(email, code)
+            except asyncio.QueueFull:
+                raise ServiceBusyException()
+            except Exception as e:
+                raise EmailSenderException()
 
-        if verify_code.code != code:
+        await verify_code_store.save(email, code)
+
+    @staticmethod
+    async def check_verify_code(email: str, code: int) -> bool:
+        verify_code_status = await verify_code_store.check(email, code)
+        if verify_code_status == VerifyCodeStatus.TOO_MANY_ATTEMPTS:
+            raise TooManyAttemptsException()
+        if verify_code_status == VerifyCodeStatus.MISSING:
+            raise IncorrectEmailAddressException()
+        if verify_code_status == VerifyCodeStatus.INVALID:
             raise IncorrectVerifyCodeException()
 
-        await self.repository.delete_verify_code_by_id(verify_code.id)
         return True
 
-    def create_access_token(self, user: User) -> str:
+    def create_access_token(self, user: User | UserPrincipal) -> str:
         jwt_payload = {
             "sub": user.short_name,
             "short_name": user.short_name,
@@ -95,7 +112,7 @@ class UserService:
             expire_minutes=auth_config.access_token_expire_minutes
         )
 
-    def create_refresh_token(self, user: User) -> str:
+    def create_refresh_token(self, user: User | UserPrincipal) -> str:
         jwt_payload = {
             "sub": user.short_name
         }
@@ -106,22 +123,38 @@ class UserService:
                 days=auth_config.refresh_token_expire_days)
         )
 
-    async def authenticate_user(self, auth_data: UserLogin) -> Optional[User]:
+    async def authenticate_user(self, auth_data: UserLogin, background_tasks: BackgroundTasks) -> Optional[User]:
         user = await self.repository.get_user_by_email(auth_data.email)
         if not user:
             raise CredentialException()
-        if not validate_password(auth_data.password, user.password_hash):
+        # Don't hold a pool connection while bcrypt runs
+        await end_transaction()
+        try:
+            is_valid_password = await validate_password_async(auth_data.password, user.password_hash)
+        except PasswordHashingBusyError:
+            raise ServiceBusyException()
+        if not is_valid_password:
             raise CredentialException()
 
+        if password_needs_rehash(user.password_hash):
+            background_tasks.add_task(self.rehash_password, user, auth_data.password)
+
         return user
 
+    async def rehash_password(self, user: User, password: str) -> None:
+        try:
+            password_hash = await hash_password_async(password)
+        except PasswordHashingBusyError:
+            return
+        await self.repository.replace_password_hash(user.id, user.password_hash, password_hash)
+
     @staticmethod
-    async def validate_admin_user(user: User) -> User:
+    async def validate_admin_user(user: UserPrincipal) -> UserPrincipal:
         if not user.is_admin:
             raise AccessException()
         return user
 
-    async def validate_user(self, expected_token_type: str, token: str | bytes) -> User:
+    async def validate_user(self, expected_token_type: str, token: str | bytes) -> UserPrincipal:
 
         try:
             payload = decode_jwt(token=token)
@@ -139,34 +172,47 @@ class UserService:
         except jwt.ExpiredSignatureError:
             raise CredentialException()
 
-        user = await self.repository.get_user_by_short_name(token_data.short_name)
+        if await token_revocation_list.is_revoked(payload):
+            raise CredentialException()
+
+        user = await self.repository.get_principal_by_short_name(token_data.short_name)
         if user is None:
             raise CredentialException()
 
         return user
 
-    async def set_base_category_id(self, user: User, category: Category) -> User:
+    async def set_base_category_id(self, user: User | UserPrincipal, category: Category) -> User:
         if category.user_id != user.id:
             raise AccessException()
-        return await self.repository.set_base_category_id(user, category.id)
+        upd_user = await self.repository.set_base_category_id(user, category.id)
+        await bump_data_version(user.id)
 
-    async def get_current_user_for_refresh(self, token: HTTPAuthorizationCredentials = Depends(http_bearer)) -> User:
+        return upd_user
+
+    async def get_current_user_for_refresh(
+            self, token: HTTPAuthorizationCredentials = Depends(http_bearer)
+    ) -> UserPrincipal:
         return await self.validate_user(expected_token_type=REFRESH_TOKEN_TYPE, token=token.credentials)
 
-    async def get_current_user(self, token: HTTPAuthorizationCredentials = Depends(http_bearer)) -> User:
+    async def get_current_user(self, token: HTTPAuthorizationCredentials = Depends(http_bearer)) -> UserPrincipal:
         return await self.validate_user(expected_token_type=ACCESS_TOKEN_TYPE, token=token.credentials)
 
-    async def get_current_admin_user(self, token: HTTPAuthorizationCredentials = Depends(http_bearer)) -> User:
+    async def get_current_admin_user(
+            self, token: HTTPAuthorizationCredentials = Depends(http_bearer)
+    ) -> UserPrincipal:
         current_user = await self.get_current_user(token)
         return await self.validate_admin_user(current_user)
 
+    async def get_user_data(self, user: UserPrincipal) -> User:
+        return await self.get_user_by_id(user.id)
+
     async def get_user_by_id(self, user_id: int) -> User:
         user = await self.repository.get_user_by_id(user_id)
         if user is None:
             raise NotFoundException()
         return user
 
-    async def add_avatar(self, avatar: UploadFile, user: User) -> User:
+    async def add_avatar(self, avatar: UploadFile, user: UserPrincipal) -> User:
         file_name = str(user.id)
 
         root = Path(__file__).parent.parent.parent
@@ -176,10 +222,21 @@ class UserService:
         with open(avatar_path, "wb+") as avatar_obj:
             shutil.copyfileobj(avatar.file, avatar_obj)
 
-        return await self.repository.save_avatar_name(file_name, user)
+        upd_user = await self.repository.save_avatar_name(file_name, user)
+        await bump_data_version(user.id)
+
+        return upd_user
 
-    async def get_all_users(self) -> List[User]:
-        return await self.repository.get_all_users()
+    async def get_all_users(self, fieldset: Optional[FieldSet] = None) -> List[User]:
+        return await self.repository.get_all_users(fieldset)
+
+    @staticmethod
+    def get_user_cache_stats() -> CacheStats:
+        return CacheStats(**user_cache.stats())
+
+    @staticmethod
+    def get_pool_stats() -> PoolStats:
+        return PoolStats(**get_pool_stats())
 
     async def create_user(self, user: UserCreate) -> User:
         if await self.repository.get_user_by_email(user.email) is not None:
@@ -188,58 +245,85 @@ class UserService:
         if await self.repository.get_user_by_short_name(user.short_name) is not None:
             raise ShortNameExistsException()
 
-        return await self.repository.create_user(user)
+        try:
+            return await self.repository.create_user(user)
+        except PasswordHashingBusyError:
+            raise ServiceBusyException()
+
+    async def edit_user_info(self, user: UserPrincipal, user_edit: UserEdit) -> User:
+        upd_user = await self.repository.edit_info(user, user_edit)
+        await bump_data_version(user.id)
 
-    async def edit_user_info(self, user: User, user_edit: UserEdit) -> User:
-        return await self.repository.edit_info(user, user_edit)
+        return upd_user
 
-    async def edit_user_password(self, user: User, password: str) -> None:
-        return await self.repository.edit_password(user, password)
+    async def edit_user_password(self, user: UserPrincipal, password: str) -> None:
+        try:
+            await self.repository.edit_password(user, password)
+        except PasswordHashingBusyError:
+            raise ServiceBusyException()
+
+        await bump_data_version(user.id)
+        await token_revocation_list.revoke_user_tokens(user.short_name)
+
+    @staticmethod
+    async def revoke_token(token: str | bytes) -> None:
+        try:
+            payload = decode_jwt(token=token)
+        except (jwt.DecodeError, jwt.ExpiredSignatureError):
+            return
+
+        jti = payload.get("jti")
+        if jti is not None:
+            expires_at = datetime.utcfromtimestamp(payload["exp"])
+            await token_revocation_list.revoke_token(jti, expires_at)
+
+    async def _raise_for_missing_non_admin(self, user_id: int) -> NoReturn:
+        # Only runs when the scoped statement matched nothing, to tell 404 from 403
+        await self.get_user_by_id(user_id)
+        raise AccessException()
 
     async def change_admin_status(self, user_id: int) -> User:
-        user = await self.get_user_by_id(user_id)
+        user = await self.repository.toggle_non_admin_flag(user_id, User.is_admin)
         if user is None:
-            raise NotFoundException()
-        if user.is_admin:
-            raise AccessException()
+            await self._raise_for_missing_non_admin(user_id)
 
-        return await self.repository.change_admin_status(user)
+        await bump_data_version(user_id)
+        return user
 
     async def change_verified_status(self, user_id: int) -> User:
-        user = await self.get_user_by_id(user_id)
+        user = await self.repository.toggle_non_admin_flag(user_id, User.is_verified)
         if user is None:
-            raise NotFoundException()
-        if user.is_admin:
-            raise AccessException()
+            await self._raise_for_missing_non_admin(user_id)
 
-        return await self.repository.change_verified_status(user)
+        await bump_data_version(user_id)
+        return user
 
     async def change_active_status(self, user_id: int) -> User:
-        user = await self.get_user_by_id(user_id)
+        user = await self.repository.toggle_non_admin_flag(user_id, User.is_active)
         if user is None:
-            raise NotFoundException()
-        if user.is_admin:
-            raise AccessException()
+            await self._raise_for_missing_non_admin(user_id)
 
-        return await self.repository.change_active_status(user)
+        await bump_data_version(user_id)
 
-    async def delete_user(self, user: User) -> None:
-        return await self.repository.delete_user(user)
+        if not user.is_active:
+            await token_revocation_list.revoke_user_tokens(user.short_name)
 
-    async def delete_user_by_id(self, user_id: int):
-        user = await self.get_user_by_id(user_id)
-        if user is None:
-            raise NotFoundException()
-        if user.is_admin:
-            raise AccessException()
+        return user
 
+    async def delete_user(self, user: UserPrincipal) -> None:
         return await self.repository.delete_user(user)
 
+    async def delete_user_by_id(self, user_id: int):
+        if not await self.repository.delete_non_admin_user_by_id(user_id):
+            await self._raise_for_missing_non_admin(user_id)
+
     async def remove_user_admin_status(self, user_id: int) -> None:
-        return await self.repository.remove_user_admin_status(user_id)
+        await self.repository.remove_user_admin_status(user_id)
+        await bump_data_version(user_id)
 
     async def remove_admin_status_for_all(self) -> None:
-        return await self.repository.remove_admin_status_for_all()
+        await self.repository.remove_admin_status_for_all()
+        await bump_all_data_versions()
 
     async def delete_all_users(self) -> None:
         return await self.repository.delete_all_users()
@@ -1,11 +1,12 @@
 from typing import Annotated
 
 from fastapi import APIRouter, Depends, UploadFile
+from fastapi.security import HTTPAuthorizationCredentials
 
 from src.users.models import User
 from src.users.schemas import UserCreate, Token, RefreshToken, UserResponse, SuccessfulResponse, UserEdit, \
-    SuccessfulGetVerifyCodeResponse, SuccessfulValidation
-from src.users.services import UserService
+    SuccessfulGetVerifyCodeResponse, SuccessfulValidation, UserPrincipal, Logout
+from src.users.services import UserService, http_bearer
 
 from src.categories.services import CategoryService
 from src.categories.schemas import CategoryCreate
@@ -47,16 +48,27 @@ async def authenticate_user_jwt(user: User = Depends(UserService().authenticate_
 
 @router.post("/refresh", response_model=RefreshToken)
 async def refresh_jwt(
-        user: Annotated[User, Depends(
-            UserService().get_current_user_for_refresh)]
+        user: Annotated[UserPrincipal, Depends(UserService().get_current_user_for_refresh)]
 ) -> RefreshToken:
     access_token = UserService().create_access_token(user)
     return RefreshToken(access_token=access_token)
 
 
+@router.post("/logout", response_model=SuccessfulResponse)
+async def logout(
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],  # noqa
+        token: Annotated[HTTPAuthorizationCredentials, Depends(http_bearer)],
+        logout_data: Logout | None = None
+) -> SuccessfulResponse:
+    await UserService().revoke_token(token.credentials)
+    if logout_data is not None and logout_data.refresh_token is not None:
+        await UserService().revoke_token(logout_data.refresh_token)
+    return SuccessfulResponse()
+
+
 @router.post("/edit_password", response_model=SuccessfulResponse)
 async def edit_user_password(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         new_password: str
 ) -> SuccessfulResponse:
     await UserService().edit_user_password(current_user, new_password)
@@ -65,14 +77,15 @@ async def edit_user_password(
 
 @router.get("/self", response_model=UserResponse)
 async def login_for_access_token(
-        current_user: Annotated[User, Depends(UserService().get_current_user)]
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)]
 ) -> UserResponse:
-    return UserResponse(**current_user.to_dict())
+    user = await UserService().get_user_data(current_user)
+    return UserResponse(**user.to_dict())
 
 
 @router.post("/avatar", response_model=UserResponse)
 async def add_avatar(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         avatar: UploadFile
 ) -> UserResponse:
     upd_user = await UserService().add_avatar(avatar, current_user)
@@ -81,7 +94,7 @@ async def add_avatar(
 
 @router.put("/edit", response_model=UserResponse)
 async def edit_user(
-        current_user: Annotated[User, Depends(UserService().get_current_user)],
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)],
         user_edit: UserEdit
 ) -> UserResponse:
     upd_user = await UserService().edit_user_info(current_user, user_edit)
@@ -90,7 +103,7 @@ async def edit_user(
 
 @router.delete("/", response_model=SuccessfulResponse)
 async def delete_user(
-        current_user: Annotated[User, Depends(UserService().get_current_user)]
+        current_user: Annotated[UserPrincipal, Depends(UserService().get_current_user)]
 ) -> SuccessfulResponse:
     await UserService().delete_user(current_user)
     return SuccessfulResponse()
@@ -0,0 +1,133 @@
+import asyncio
+import datetime
+from abc import ABC, abstractmethod
+from enum import Enum
+from typing import List
+
+from config_data.config import Config, load_config
+from utils.cache import TTLCache
+
+from src.users.repositories import UserRepository
+
+settings: Config = load_config(".env")
+verify_codes_config = settings.verify_codes
+
+
+class VerifyCodeStatus(Enum):
+    VALID = "valid"
+    INVALID = "invalid"
+    MISSING = "missing"
+    TOO_MANY_ATTEMPTS = "too_many_attempts"
+
+
+class VerifyCodeStore(ABC):
+    def __init__(self, ttl: int, max_attempts: int, max_size: int):
+        self.ttl = ttl
+        self.max_attempts = max_attempts
+        # Attempts are claimed in memory before the backend is asked, so brute force never reaches it.
+        # Backends count failed attempts next to the code as well, evicting a counter here resets nothing
+        self.attempts = TTLCache(maxsize=max_size, ttl=ttl)
+
+    @abstractmethod
+    async def _save(self, email: str, code: int) -> None:
+        ...
+
+    @abstractmethod
+    async def _check(self, email: str, code: int) -> VerifyCodeStatus:
+        ...
+
+    async def sweep(self) -> None:
+        self.attempts.sweep()
+
+    async def save(self, email: str, code: int) -> None:
+        await self._save(email, code)
+        self.attempts.invalidate(email)
+
+    async def check(self, email: str, code: int) -> VerifyCodeStatus:
+        # Counted before awaiting the backend, so concurrent guesses can't all pass on the same count
+        attempts = (self.attempts.get(email) or 0) + 1
+        if attempts > self.max_attempts:
+            return VerifyCodeStatus.TOO_MANY_ATTEMPTS
+        self.attempts.set(email, attempts)
+
+        status = await self._check(email, code)
+        if status == VerifyCodeStatus.VALID:
+            self.attempts.invalidate(email)
+
+        return status
+
+    async def run_periodic_sweep(self, interval: int) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sweep()
+            except Exception:  # noqa
+                continue
+
+
+class MemoryVerifyCodeStore(VerifyCodeStore):
+    def __init__(self, ttl: int, max_attempts: int, max_size: int):
+        super().__init__(ttl, max_attempts, max_size)
+        # [code, failed attempts]
+        self.codes = TTLCache(maxsize=max_size, ttl=ttl)
+
+    async def _save(self, email: str, code: int) -> None:
+        self.codes.set(email, [code, 0])
+
+    async def _check(self, email: str, code: int) -> VerifyCodeStatus:
+        entry: List[int] = self.codes.get(email)
+        if entry is None:
+            return VerifyCodeStatus.MISSING
+        if entry[1] >= self.max_attempts:
+            return VerifyCodeStatus.TOO_MANY_ATTEMPTS
+        if entry[0] != code:
+            entry[1] += 1
+            return VerifyCodeStatus.INVALID
+
+        self.codes.invalidate(email)
+        return VerifyCodeStatus.VALID
+
+    async def sweep(self) -> None:
+        await super().sweep()
+        self.codes.sweep()
+
+
+class DatabaseVerifyCodeStore(VerifyCodeStore):
+    repository = UserRepository()
+
+    async def _save(self, email: str, code: int) -> None:
+        expires_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=self.ttl)
+        await self.repository.save_verify_code(email, code, expires_at)
+
+    async def _check(self, email: str, code: int) -> VerifyCodeStatus:
+        if await self.repository.pop_verify_code(email, code, self.max_attempts):
+            return VerifyCodeStatus.VALID
+
+        attempts = await self.repository.count_verify_code_attempt(email)
+        if attempts is None:
+            return VerifyCodeStatus.MISSING
+        if attempts > self.max_attempts:
+            return VerifyCodeStatus.TOO_MANY_ATTEMPTS
+        return VerifyCodeStatus.INVALID
+
+    async def sweep(self) -> None:
+        await super().sweep()
+        await self.repository.delete_expired_verify_codes()
+
+
+def create_verify_code_store(store: str = verify_codes_config.STORE) -> VerifyCodeStore:
+    stores = {
+        "memory": MemoryVerifyCodeStore,
+        "database": DatabaseVerifyCodeStore,
+    }
+    if store not in stores:
+        raise ValueError(f"Unknown verify codes store {store!r}")
+
+    return stores[store](
+        ttl=verify_codes_config.TTL,
+        max_attempts=verify_codes_config.MAX_ATTEMPTS,
+        max_size=verify_codes_config.MAX_SIZE
+    )
+
+
+verify_code_store = create_verify_code_store()
@@ -3,13 +3,17 @@ import os
 import pytest
 import pytest_asyncio
 
-from typing import AsyncGenerator, List, Dict, Generator
+from contextlib import contextmanager
+from typing import AsyncGenerator, Awaitable, Callable, List, Dict, Generator, Iterator
 from pathlib import Path
 from copy import deepcopy
+from uuid import uuid4
 from fastapi.testclient import TestClient
 from httpx import AsyncClient, ASGITransport
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import AsyncEngine
 
-from src.database import clear_tables
+from src.database import clear_tables, engine
 from main import app
 from src.users.repositories import UserRepository
 from config_data.config import Config, load_config
@@ -41,6 +45,16 @@ TEST_ADMIN_DATA = {
 
 USERS: List[Dict] = list()
 
+# Outcome of every test that ran in this session so far, by node id
+TEST_OUTCOMES: Dict[str, str] = dict()
+
+
+def pytest_runtest_logreport(report: pytest.TestReport) -> None:
+    if report.failed:
+        TEST_OUTCOMES[report.nodeid] = "failed"
+    elif report.when == "call" and report.nodeid not in TEST_OUTCOMES:
+        TEST_OUTCOMES[report.nodeid] = report.outcome
+
 
 @pytest.fixture(scope="session", autouse=True)
 def event_loop() -> Generator:
@@ -71,6 +85,59 @@ async def client() -> AsyncGenerator[TestClient, None]:
         yield client
 
 
+@pytest_asyncio.fixture(loop_scope="session")
+async def register_user(client: AsyncClient) -> AsyncGenerator[Callable[..., Awaitable[Dict[str, str]]], None]:
+    # Registers users of the test's own and gives their auth headers, the users are deleted after the test
+    emails = []
+
+    async def register(**fields: str) -> Dict[str, str]:
+        short_name = f"user_{uuid4().hex[:12]}"
+        user_data = {
+            "name": "TestName",
+            "surname": "TestSurname",
+            "short_name": short_name,
+            "email": f"{short_name}@example.com",
+            "gender": "male",
+            "password": "TestPassword",
+            **fields
+        }
+        response = await client.post("/user/register", json=user_data)
+        assert response.status_code == 200
+        emails.append(user_data["email"])
+        return {"Authorization": f'Bearer {response.json()["access_token"]}'}
+
+    yield register
+
+    for email in emails:
+        user = await UserRepository().get_user_by_email(email)
+        if user is not None:
+            await UserRepository().delete_user(user)
+
+
+@pytest_asyncio.fixture(loop_scope="session")
+async def registered_user(register_user) -> Dict[str, str]:
+    return await register_user()
+
+
+@contextmanager
+def capture_statements(target_engine: AsyncEngine = engine) -> Iterator[List[str]]:
+    # SQL sent through the engine inside the block
+    statements: List[str] = []
+    listener = lambda conn, cursor, statement, *args: statements.append(statement)  # noqa: E731
+    event.listen(target_engine.sync_engine, "before_cursor_execute", listener)
+    try:
+        yield statements
+    finally:
+        event.remove(target_engine.sync_engine, "before_cursor_execute", listener)
+
+
+@pytest.fixture
+def captured_statements() -> Generator[List[str], None, None]:
+    # SQL the test sends to the primary, clear it to start watching from a later point
+    with capture_statements() as statements:
+        yield statements
+
+
 @pytest.fixture(scope="module")
 def get_test_users_data() -> List[Dict]:
     users = []
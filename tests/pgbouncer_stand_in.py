@@ -0,0 +1,199 @@
+import asyncio
+import hashlib
+import struct
+from typing import Dict, List, Optional, Tuple
+
+SSL_REQUEST_CODE = 80877103
+CANCEL_REQUEST_CODE = 80877102
+PROTOCOL_VERSION = 196608
+
+# Startup parameters PgBouncer accepts by default, anything else is rejected like it does
+SUPPORTED_PARAMETERS = {"user", "database", "application_name", "client_encoding", "datestyle", "timezone",
+                        "standard_conforming_strings"}
+
+
+def _message(message_type: bytes, body: bytes = b"") -> bytes:
+    return message_type + struct.pack("!I", len(body) + 4) + body
+
+
+def _error(message: str) -> bytes:
+    return _message(b"E", b"SFATAL\x00C08P01\x00M" + message.encode() + b"\x00\x00")
+
+
+async def _read_message(reader: asyncio.StreamReader) -> Tuple[bytes, bytes]:
+    header = await reader.readexactly(5)
+    length = struct.unpack("!I", header[1:])[0]
+    return header[:1], await reader.readexactly(length - 4)
+
+
+class ServerConnection:
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        self.reader = reader
+        self.writer = writer
+        self.parameters: Dict[str, str] = {}
+
+    def close(self) -> None:
+        self.writer.close()
+
+
+# Minimal transaction pooling proxy in the spirit of PgBouncer's pool_mode=transaction: a
+# client gets a server connection for one transaction only, and consecutive transactions
+# of a client usually land on different server connections. Supports the simple and the
+# extended query protocol as used by asyncpg, not COPY or Flush based pipelining.
+class TransactionPoolerStandIn:
+    def __init__(self, host: str, port: int, user: str, password: str, database: str, pool_size: int = 4):
+        self.upstream = (host, port)
+        self.user = user
+        self.password = password
+        self.database = database
+        self.pool_size = pool_size
+        self.port = 0
+        self.transactions = 0
+        self.rejected_parameters: List[str] = []
+        self._idle: Optional[asyncio.Queue[ServerConnection]] = None
+        self._parameters: Dict[str, str] = {}
+        self._server: Optional[asyncio.Server] = None
+        self._clients: set[asyncio.Task] = set()
+        self._stopping = False
+
+    async def start(self) -> None:
+        self._idle = asyncio.Queue()
+        for _ in range(self.pool_size):
+            self._idle.put_nowait(await self._connect())
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._stopping = True
+        self._server.close()
+        for task in list(self._clients):
+            task.cancel()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+        await self._server.wait_closed()
+        while not self._idle.empty():
+            self._idle.get_nowait().close()
+
+    async def _connect(self) -> ServerConnection:
+        reader, writer = await asyncio.open_connection(*self.upstream)
+        server = ServerConnection(reader, writer)
+        body = struct.pack("!I", PROTOCOL_VERSION)
+        # asyncpg always asks for UTF8, PgBouncer would set it on the server connection
+        for key, value in (("user", self.user), ("database", self.database), ("client_encoding", "UTF8")):
+            body += key.encode() + b"\x00" + value.encode() + b"\x00"
+        body += b"\x00"
+        writer.write(struct.pack("!I", len(body) + 4) + body)
+
+        while True:
+            message_type, body = await _read_message(reader)
+            if message_type == b"R":
+                code = struct.unpack("!I", body[:4])[0]
+                if code == 3:
+                    writer.write(_message(b"p", self.password.encode() + b"\x00"))
+                elif code == 5:
+                    inner = hashlib.md5((self.password + self.user).encode()).hexdigest().encode()
+                    digest = b"md5" + hashlib.md5(inner + body[4:8]).hexdigest().encode()
+                    writer.write(_message(b"p", digest + b"\x00"))
+                elif code != 0:
+                    raise ConnectionError(f"Unsupported authentication method {code}")
+            elif message_type == b"S":
+                key, value = body.split(b"\x00")[:2]
+                server.parameters[key.decode()] = value.decode()
+            elif message_type == b"E":
+                raise ConnectionError(body.decode(errors="replace"))
+            elif message_type == b"Z":
+                break
+
+        self._parameters = self._parameters or server.parameters
+        return server
+
+    async def _acquire(self) -> ServerConnection:
+        server = await self._idle.get()
+        self.transactions += 1
+        return server
+
+    async def _release(self, server: ServerConnection, reusable: bool) -> None:
+        if reusable:
+            self._idle.put_nowait(server)
+            return
+
+        server.close()
+        if not self._stopping:
+            self._idle.put_nowait(await self._connect())
+
+    async def _startup(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> bool:
+        while True:
+            length = struct.unpack("!I", await reader.readexactly(4))[0]
+            body = await reader.readexactly(length - 4)
+            code = struct.unpack("!I", body[:4])[0]
+            if code == SSL_REQUEST_CODE:
+                writer.write(b"N")
+                await writer.drain()
+                continue
+            if code == CANCEL_REQUEST_CODE:
+                return False
+            break
+
+        items = body[4:].rstrip(b"\x00").split(b"\x00")
+        parameters = dict(zip(items[::2], items[1::2]))
+        unsupported = [key.decode() for key in parameters if key.decode().lower() not in SUPPORTED_PARAMETERS]
+        if unsupported:
+            self.rejected_parameters.extend(unsupported)
+            writer.write(_error(f"unsupported startup parameter: {unsupported[0]}"))
+            await writer.drain()
+            return False
+
+        reply = _message(b"R", struct.pack("!I", 0))
+        for key, value in self._parameters.items():
+            reply += _message(b"S", key.encode() + b"\x00" + value.encode() + b"\x00")
+        reply += _message(b"K", struct.pack("!II", 0, 0))
+        reply += _message(b"Z", b"I")
+        writer.write(reply)
+        await writer.drain()
+        return True
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        task = asyncio.current_task()
+        self._clients.add(task)
+        server: Optional[ServerConnection] = None
+        replies: Optional[asyncio.Task] = None
+
+        async def forward_replies(connection: ServerConnection) -> None:
+            nonlocal server
+            while True:
+                reply_type, reply = await _read_message(connection.reader)
+                if reply_type == b"Z" and reply == b"I":
+                    # The transaction is over, the connection goes back to the pool before
+                    # the client can see the reply and start the next one
+                    server = None
+                    await self._release(connection, reusable=True)
+                writer.write(_message(reply_type, reply))
+                await writer.drain()
+                if server is not connection:
+                    return
+
+        try:
+            if not await self._startup(reader, writer):
+                return
+
+            while True:
+                message_type, body = await _read_message(reader)
+                if message_type == b"X":
+                    return
+
+                if server is None:
+                    if replies is not None:
+                        await replies
+                    server = await self._acquire()
+                    replies = asyncio.create_task(forward_replies(server))
+                server.writer.write(_message(message_type, body))
+                await server.writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self._clients.discard(task)
+            if replies is not None:
+                replies.cancel()
+            if server is not None:
+                # The client went away in the middle of a transaction
+                await self._release(server, reusable=False)
+            writer.close()
@@ -0,0 +1,54 @@
+import asyncio
+from typing import List
+
+
+class SMTPStandIn:
+    def __init__(self, fail_data_times: int = 0):
+        self.fail_data_times = fail_data_times
+        self.connections = 0
+        self.messages: List[bytes] = []
+        self.port = 0
+        self._server: asyncio.Server | None = None
+
+    async def start(self) -> None:
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", 0)
+        self.port = self._server.sockets[0].getsockname()[1]
+
+    async def stop(self) -> None:
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        writer.write(b"220 stand-in ESMTP\r\n")
+
+        while line := await reader.readline():
+            verb = line.decode().strip().split(" ", 1)[0].upper()
+            if verb == "EHLO":
+                writer.write(b"250-stand-in\r\n250-AUTH PLAIN\r\n250 OK\r\n")
+            elif verb == "AUTH":
+                writer.write(b"235 Authentication successful\r\n")
+            elif verb in ("HELO", "MAIL", "RCPT", "RSET", "NOOP"):
+                writer.write(b"250 OK\r\n")
+            elif verb == "DATA":
+                if self.fail_data_times > 0:
+                    self.fail_data_times -= 1
+                    writer.write(b"451 Try again later\r\n")
+                    continue
+
+                writer.write(b"354 End data with <CR><LF>.<CR><LF>\r\n")
+                await writer.drain()
+                data = []
+                while (data_line := await reader.readline()) != b".\r\n":
+                    data.append(data_line)
+                self.messages.append(b"".join(data))
+                writer.write(b"250 Queued\r\n")
+            elif verb == "QUIT":
+                writer.write(b"221 Bye\r\n")
+                await writer.drain()
+                break
+            else:
+                writer.write(b"502 Command not implemented\r\n")
+            await writer.drain()
+
+        writer.close()
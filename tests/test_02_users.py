@@ -1,9 +1,26 @@
+import asyncio
+from dataclasses import replace
+
+import jwt
 import pytest
+from cryptography.hazmat.primitives.asymmetric import ed25519
 from httpx import AsyncClient
+from sqlalchemy import event
 from copy import deepcopy
 
 from tests.conftest import create_user_helper, get_token_helper, TEST_DATA, TESTS_DATA_TEMPLATE
-from src.users.schemas import SuccessfulResponse
+from src.users.schemas import SuccessfulResponse, UserPrincipal
+from src.database import engine, session_scope
+from src.users.revocation import token_revocation_list
+from src.users.repositories import UserRepository, user_cache
+from src.users import services
+from src.users.verify_codes import verify_codes_config, verify_code_store, DatabaseVerifyCodeStore, \
+    MemoryVerifyCodeStore, VerifyCodeStatus
+from utils.email_sender import MailQueue, email_sender, _build_verification_message
+from tests.smtp_stand_in import SMTPStandIn
+from utils.auth_settings import encode_jwt, decode_jwt, verified_tokens_cache, hash_password, hash_password_async, \
+    validate_password_async, hashing_config, PasswordHashingBusyError, password_needs_rehash, verification_keys, \
+    signing_key, auth_config
 
 
 @pytest.mark.asyncio
@@ -20,6 +37,116 @@ async def test_create_users(client: AsyncClient, get_test_users_data):
         TEST_DATA[user_data["email"]] = deepcopy(TESTS_DATA_TEMPLATE)
 
 
+@pytest.mark.asyncio
+async def test_verify_code(client: AsyncClient):
+    email = "verify_code_user@example.com"
+    response = await client.get("/user/register/verify_code", params={"email": email})
+    assert response.status_code == 200
+
+    for _ in range(verify_codes_config.MAX_ATTEMPTS):
+        response = await client.post("/user/register/verify_code", params={"email": email, "code": 1})
+        assert response.status_code == 400
+    response = await client.post("/user/register/verify_code", params={"email": email, "code": 77777})
+    assert response.status_code == 429
+
+    response = await client.get("/user/register/verify_code", params={"email": email})
+    assert response.status_code == 200
+    response = await client.post("/user/register/verify_code", params={"email": email, "code": 77777})
+    assert response.status_code == 200
+    response = await client.post("/user/register/verify_code", params={"email": email, "code": 77777})
+    assert response.status_code == 400
+
+    response = await client.get("/user/register/verify_code", params={"email": "not an email"})
+    assert response.status_code == 400
+
+
+@pytest.mark.asyncio
+async def test_verify_code_mail_queue_full(client: AsyncClient, monkeypatch):
+    def queue_full(*args):
+        raise asyncio.QueueFull()
+
+    monkeypatch.setattr(services.settings.variablesData, "MODE", "PROD")
+    monkeypatch.setattr(services, "send_verification_code", queue_full)
+    email = "verify_code_busy_user@example.com"
+    response = await client.get("/user/register/verify_code", params={"email": email})
+    assert response.status_code == 503
+    # No code that was never sent
+    assert await verify_code_store.check(email, 77777) == VerifyCodeStatus.MISSING
+
+
+@pytest.mark.asyncio
+async def test_database_verify_code_store():
+    store = DatabaseVerifyCodeStore(ttl=60, max_attempts=1, max_size=10)
+    email = "verify_code_db_user@example.com"
+
+    assert await store.check(email, 12345) == VerifyCodeStatus.MISSING
+    await store.save(email, 12345)
+    assert await store.check(email, 54321) == VerifyCodeStatus.INVALID
+    assert await store.check(email, 12345) == VerifyCodeStatus.TOO_MANY_ATTEMPTS
+
+    await store.save(email, 12345)
+    assert await store.check(email, 12345) == VerifyCodeStatus.VALID
+    assert await store.check(email, 12345) == VerifyCodeStatus.MISSING
+
+    expired_store = DatabaseVerifyCodeStore(ttl=-1, max_attempts=1, max_size=10)
+    await expired_store.save(email, 12345)
+    assert await expired_store.check(email, 12345) == VerifyCodeStatus.MISSING
+    await expired_store.sweep()
+
+
+@pytest.mark.asyncio
+async def test_verify_code_attempts():
+    backend_checks = 0
+
+    class SlowStore(MemoryVerifyCodeStore):
+        async def _check(self, email: str, code: int) -> VerifyCodeStatus:
+            nonlocal backend_checks
+            backend_checks += 1
+            await asyncio.sleep(0.01)
+            return await super()._check(email, code)
+
+    store = SlowStore(ttl=60, max_attempts=3, max_size=10)
+    email = "verify_code_burst_user@example.com"
+    await store.save(email, 12345)
+    statuses = await asyncio.gather(*(store.check(email, 10000 + i) for i in range(20)))
+    assert backend_checks == 3
+    assert statuses.count(VerifyCodeStatus.INVALID) == 3
+    assert await store.check(email, 12345) == VerifyCodeStatus.TOO_MANY_ATTEMPTS
+
+    # Evicting the in-memory counters with other emails doesn't reset the attempts
+    for store in (MemoryVerifyCodeStore(ttl=60, max_attempts=1, max_size=2),
+                  DatabaseVerifyCodeStore(ttl=60, max_attempts=1, max_size=2)):
+        await store.save(email, 12345)
+        assert await store.check(email, 54321) == VerifyCodeStatus.INVALID
+        for i in range(store.attempts.maxsize):
+            await store.check(f"verify_code_filler_{i}@example.com", 12345)
+        assert store.attempts.get(email) is None
+        assert await store.check(email, 12345) == VerifyCodeStatus.TOO_MANY_ATTEMPTS
+
+
+@pytest.mark.asyncio
+async def test_mail_queue():
+    server = SMTPStandIn(fail_data_times=1)
+    await server.start()
+
+    config = replace(email_sender, SMTP_HOST="127.0.0.1", SMTP_PORT=server.port, SMTP_STARTTLS=False, WORKERS=2,
+                     RETRY_BACKOFF=0.01)
+    mail_queue = MailQueue(config)
+    await mail_queue.start()
+    for i in range(10):
+        mail_queue.enqueue(_build_verification_message(f"mail_queue_{i}@example.com", 10000 + i, config.EMAIL_NAME))
+
+    await asyncio.wait_for(mail_queue.join(), timeout=10)
+    await mail_queue.stop()
+    await server.stop()
+
+    assert mail_queue.sent == 10
+    assert mail_queue.failed == 0
+    assert len(server.messages) == 10
+    # One connection per worker plus a reconnect after the failed delivery
+    assert server.connections <= config.WORKERS + 1
+
+
 @pytest.mark.asyncio
 async def test_login_users(client: AsyncClient, get_test_users_data):
     for user_data in get_test_users_data:
@@ -67,6 +194,171 @@ async def test_self_user(client: AsyncClient, get_test_users_data):
         assert resp_dict["categories"][0]["user_id"] == resp_dict["id"]
 
 
+@pytest.mark.asyncio
+async def test_user_principal(client: AsyncClient, get_test_users_data):
+    for user_data in get_test_users_data:
+        if user_data["email"] not in TEST_DATA:
+            await create_user_helper(client, user_data)
+
+        principal = await UserRepository().get_principal_by_short_name(user_data["short_name"])
+        assert isinstance(principal, UserPrincipal)
+        assert principal.short_name == user_data["short_name"]
+        assert principal.email == user_data["email"]
+        assert principal.is_admin is False
+        assert principal.is_active is True
+
+    assert await UserRepository().get_principal_by_short_name("non_existed_user") is None
+
+
+@pytest.mark.asyncio
+async def test_user_cache(client: AsyncClient, get_test_users_data):
+    user_data = get_test_users_data[0]
+    if user_data["email"] not in TEST_DATA:
+        await create_user_helper(client, user_data)
+
+    user_cache.invalidate(user_data["short_name"])
+    hits, misses = user_cache.hits, user_cache.misses
+
+    principal = await UserRepository().get_principal_by_short_name(user_data["short_name"])
+    assert await UserRepository().get_principal_by_short_name(user_data["short_name"]) is principal
+    assert user_cache.misses == misses + 1
+    assert user_cache.hits == hits + 1
+
+    await UserRepository().set_base_category_id(principal, principal.base_category_id)
+    assert await UserRepository().get_principal_by_short_name(user_data["short_name"]) is not principal
+    assert user_cache.misses == misses + 2
+
+
+def test_verified_tokens_cache():
+    token = encode_jwt(payload={"sub": "cached_user", "type": "access"})
+    hits = verified_tokens_cache.hits
+
+    payload = decode_jwt(token=token)
+    assert decode_jwt(token=token) == payload
+    assert verified_tokens_cache.hits == hits + 1
+    assert payload["sub"] == "cached_user"
+
+
+def test_jwt_key_rotation(monkeypatch):
+    previous_key = ed25519.Ed25519PrivateKey.generate()
+    token = encode_jwt(payload={"sub": "rotated_user"}, private_key=previous_key, algorithm="EdDSA")
+    with pytest.raises(jwt.InvalidSignatureError):
+        decode_jwt(token=token)
+
+    kid = jwt.get_unverified_header(token)["kid"]
+    monkeypatch.setitem(verification_keys, kid, (previous_key.public_key(), "EdDSA"))
+    assert decode_jwt(token=token)["sub"] == "rotated_user"
+
+    legacy_token = jwt.encode({"sub": "legacy_user", "exp": 2 ** 32}, signing_key, algorithm=auth_config.algorithm)
+    assert decode_jwt(token=legacy_token)["sub"] == "legacy_user"
+    previous_legacy_token = jwt.encode({"sub": "legacy_user", "exp": 2 ** 32}, previous_key, algorithm="EdDSA")
+    assert decode_jwt(token=previous_legacy_token)["sub"] == "legacy_user"
+
+    # Cached claims go with the key that verified them
+    monkeypatch.delitem(verification_keys, kid)
+    for rotated_out_token in (token, previous_legacy_token):
+        with pytest.raises(jwt.InvalidSignatureError):
+            decode_jwt(token=rotated_out_token)
+    assert decode_jwt(token=legacy_token)["sub"] == "legacy_user"
+
+
+@pytest.mark.asyncio
+async def test_password_hashing_admission(monkeypatch):
+    password_hash = await hash_password_async("TestPassword")
+    assert await validate_password_async("TestPassword", password_hash) is True
+    assert await validate_password_async("WrongPassword", password_hash) is False
+
+    monkeypatch.setattr(hashing_config, "QUEUE_LIMIT", 0)
+    results = await asyncio.gather(
+        *[validate_password_async("TestPassword", password_hash) for _ in range(hashing_config.WORKERS + 1)],
+        return_exceptions=True
+    )
+    assert sum(isinstance(result, PasswordHashingBusyError) for result in results) == 1
+    assert results.count(True) == hashing_config.WORKERS
+
+
+@pytest.mark.asyncio
+async def test_password_rehash_on_login(client: AsyncClient, get_test_users_data):
+    user_data = get_test_users_data[0]
+    if user_data["email"] not in TEST_DATA:
+        await create_user_helper(client, user_data)
+
+    user = await UserRepository().get_user_by_email(user_data["email"])
+    weak_hash = hash_password(user_data["password"], rounds=4)
+    assert password_needs_rehash(weak_hash)
+    await UserRepository().replace_password_hash(user.id, user.password_hash, weak_hash)
+
+    auth_data = {
+        "email": user_data["email"],
+        "password": user_data["password"]
+    }
+    response = await client.post("/user/login", json=auth_data)
+    assert response.status_code == 200
+
+    user = await UserRepository().get_user_by_email(user_data["email"])
+    assert user.password_hash != weak_hash
+    assert not password_needs_rehash(user.password_hash)
+
+
+@pytest.mark.asyncio
+async def test_token_revocation(client: AsyncClient, register_user, monkeypatch):
+    auth_data = {"email": "revoked_user@example.com", "password": "RevokedPassword"}
+    await register_user(**auth_data)
+    response = await client.post("/user/login", json=auth_data)
+    assert response.status_code == 200
+    tokens = response.json()
+    headers = {"Authorization": f'Bearer {tokens["access_token"]}'}
+
+    response = await client.post("/user/logout", json={"refresh_token": tokens["refresh_token"]}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == SuccessfulResponse().dict()
+
+    response = await client.get("/user/self", headers=headers)
+    assert response.status_code == 401
+    response = await client.post("/user/refresh", headers={"Authorization": f'Bearer {tokens["refresh_token"]}'})
+    assert response.status_code == 401
+
+    response = await client.post("/user/login", json=auth_data)
+    assert response.status_code == 200
+    headers = {"Authorization": f'Bearer {response.json()["access_token"]}'}
+
+    response = await client.post("/user/edit_password", params={"new_password": "NewRevokedPassword"}, headers=headers)
+    assert response.status_code == 200
+    response = await client.get("/user/self", headers=headers)
+    assert response.status_code == 401
+
+    auth_data["password"] = "NewRevokedPassword"
+    response = await client.post("/user/login", json=auth_data)
+    assert response.status_code == 200
+    headers = {"Authorization": f'Bearer {response.json()["access_token"]}'}
+
+    response = await client.get("/user/self", headers=headers)
+    assert response.status_code == 200
+
+    # Loading the list on first use keeps its cleanup out of the request's unit of work
+    monkeypatch.setattr(token_revocation_list, "_bloom", None)
+    async with session_scope() as session:
+        assert not await token_revocation_list.is_revoked({"sub": "nobody", "jti": "0" * 32})
+        assert not session.info.get("has_writes")
+        assert not session.in_transaction()
+    assert token_revocation_list._bloom is not None
+
+
+@pytest.mark.asyncio
+async def test_request_scoped_session(client: AsyncClient, registered_user):
+    checkouts = []
+    listener = lambda *args: checkouts.append(args)  # noqa: E731
+    event.listen(engine.sync_engine, "checkout", listener)
+    try:
+        # Authentication, the user lookup and the categories query share one connection
+        user_cache.clear()
+        response = await client.get("/categories/", headers=registered_user)
+        assert response.status_code == 200
+        assert len(checkouts) == 1
+    finally:
+        event.remove(engine.sync_engine, "checkout", listener)
+
+
 @pytest.mark.asyncio
 async def test_edit_user(client: AsyncClient, get_test_users_data):
     for user_data in get_test_users_data:
@@ -198,3 +198,109 @@ async def test_delete_category(client: AsyncClient, get_test_users_data, get_tes
         headers={"Authorization": f'Bearer {TEST_DATA[get_test_users_data[0]["email"]]["access_token"]}'}
     )
     assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_category_writes_use_returning(client: AsyncClient, registered_user, captured_statements):
+    captured_statements.clear()
+    response = await client.post(
+        "/categories/",
+        json={"name": "Returning", "color": "#000000"},
+        headers=registered_user
+    )
+    assert response.status_code == 200
+    category = response.json()
+    assert category["name"] == "Returning"
+    create_statements = captured_statements[:]
+
+    captured_statements.clear()
+
+    response = await client.put(
+        f'/categories/{category["id"]}',
+        json={"name": "Returned", "color": "#FFFFFF"},
+        headers=registered_user
+    )
+    assert response.status_code == 200
+    assert response.json()["name"] == "Returned"
+    edit_statements = captured_statements[:]
+
+    # The written row comes back from the write itself, not from a second SELECT
+    for verb, request_statements in (("INSERT INTO categories", create_statements),
+                                     ("UPDATE categories", edit_statements)):
+        index = next(i for i, statement in enumerate(request_statements) if statement.startswith(verb))
+        assert "RETURNING" in request_statements[index]
+        assert not any(statement.startswith("SELECT categories") for statement in request_statements[index + 1:])
+
+
+@pytest.mark.asyncio
+async def test_delete_category_moves_tasks(client: AsyncClient, register_user, captured_statements):
+    headers = [await register_user() for _ in range(2)]
+
+    response = await client.get("/categories/", headers=headers[0])
+    base_category_id = response.json()[0]["id"]
+    response = await client.post("/categories/", json={"name": "Removed", "color": "#000000"}, headers=headers[0])
+    category_id = response.json()["id"]
+
+    task_ids = []
+    for i in range(20):
+        task_data = {
+            "name": f"Moved_{i}",
+            "description": "Moved task",
+            "priority": 1,
+            "category_id": category_id,
+            "date": "2025-01-01"
+        }
+        response = await client.post("/tasks/", json=task_data, headers=headers[0])
+        assert response.status_code == 200
+        task_ids.append(response.json()["id"])
+
+    response = await client.delete(f"/categories/{category_id}", headers=headers[1])
+    assert response.status_code == 404
+    response = await client.delete(f"/categories/{base_category_id}", headers=headers[0])
+    assert response.status_code == 404
+
+    captured_statements.clear()
+    response = await client.delete(f"/categories/{category_id}", headers=headers[0])
+    assert response.status_code == 200
+    assert response.json() == SuccessfulResponse().dict()
+
+    assert len([statement for statement in captured_statements if statement.startswith("UPDATE tasks")]) == 1
+    assert not any(statement.startswith("SELECT tasks") for statement in captured_statements)
+
+    response = await client.get(f"/categories/{category_id}", headers=headers[0])
+    assert response.status_code == 404
+    response = await client.get(f"/categories/{base_category_id}", headers=headers[0])
+    assert sorted(task["id"] for task in response.json()["tasks"]) == sorted(task_ids)
+
+
+@pytest.mark.asyncio
+async def test_categories_sparse_fieldsets(client: AsyncClient, registered_user, captured_statements):
+    response = await client.get("/categories/", headers=registered_user)
+    category = response.json()[0]
+    task_data = {
+        "name": "Fields",
+        "description": "Fields task",
+        "priority": 1,
+        "category_id": category["id"],
+        "date": "2025-01-01"
+    }
+    response = await client.post("/tasks/", json=task_data, headers=registered_user)
+    task = response.json()
+
+    captured_statements.clear()
+    response = await client.get("/categories/", params={"fields": "id,name", "include": ""}, headers=registered_user)
+    assert response.status_code == 200
+    assert response.json() == [{"id": category["id"], "name": category["name"]}]
+    assert not any("FROM tasks" in statement for statement in captured_statements)
+    select_categories = next(statement for statement in captured_statements if "FROM categories" in statement)
+    assert "categories.color" not in select_categories
+
+    response = await client.get("/categories/", params={"fields": "name", "include": "tasks"}, headers=registered_user)
+    assert response.json() == [{"name": category["name"], "tasks": [task]}]
+
+    response = await client.get("/categories/", headers=registered_user)
+    assert response.json() == [{**category, "tasks": [task]}]
+    response = await client.get("/categories/", params={"fields": "password"}, headers=registered_user)
+    assert response.status_code == 400
+    response = await client.get("/categories/", params={"include": "user"}, headers=registered_user)
+    assert response.status_code == 400
@@ -1,8 +1,16 @@
+import asyncio
+import datetime
+
 import pytest
 from httpx import AsyncClient
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
-from src.tasks.schemas import SuccessfulResponse
-from tests.conftest import create_user_helper, get_token_helper, TEST_DATA, get_tasks_helper, create_tasks_helper
+from src import database
+from src.database import connect_args, engine, session_scope
+from src.tasks.repositories import TaskRepository
+from src.tasks.schemas import SuccessfulResponse, TaskFilters
+from tests.conftest import config, create_user_helper, get_token_helper, TEST_DATA, get_tasks_helper, \
+    create_tasks_helper, capture_statements
 
 
 @pytest.mark.asyncio
@@ -298,3 +306,398 @@ async def test_delete_task(client: AsyncClient, get_test_users_data, get_test_ta
         headers={"Authorization": f'Bearer {TEST_DATA[get_test_users_data[0]["email"]]["access_token"]}'}
     )
     assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_scoped_task_mutations(client: AsyncClient, register_user):
+    headers = [await register_user() for _ in range(2)]
+
+    response = await client.get("/categories/", headers=headers[0])
+    task_data = {
+        "name": "Scoped",
+        "description": "Scoped task",
+        "priority": 1,
+        "category_id": response.json()[0]["id"],
+        "date": "2025-01-01"
+    }
+    response = await client.post("/tasks/", json=task_data, headers=headers[0])
+    assert response.status_code == 200
+    task = response.json()
+
+    # Every toggle flips the stored value, so an even number of concurrent toggles cancels out
+    responses = await asyncio.gather(
+        *(client.put(f'/tasks/{task["id"]}/change_status', headers=headers[0]) for _ in range(10))
+    )
+    assert all(response.status_code == 200 for response in responses)
+    assert sorted(response.json()["completed"] for response in responses) == [False] * 5 + [True] * 5
+    response = await client.get(f'/tasks/{task["id"]}', headers=headers[0])
+    assert response.json()["completed"] == task["completed"]
+
+    # Another user's task looks like a missing one
+    response = await client.put(f'/tasks/{task["id"]}/change_status', headers=headers[1])
+    assert response.status_code == 404
+    response = await client.put(f'/tasks/{task["id"]}', json=task_data, headers=headers[1])
+    assert response.status_code == 404
+    response = await client.delete(f'/tasks/{task["id"]}', headers=headers[1])
+    assert response.status_code == 404
+
+    response = await client.put(f'/tasks/{task["id"]}', json={**task_data, "name": "Edited"}, headers=headers[0])
+    assert response.status_code == 200
+    assert response.json()["name"] == "Edited"
+    response = await client.put(f'/tasks/{task["id"]}', json={**task_data, "category_id": -1}, headers=headers[0])
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Category not found"
+
+    response = await client.delete(f'/tasks/{task["id"]}', headers=headers[0])
+    assert response.status_code == 200
+    response = await client.delete(f'/tasks/{task["id"]}', headers=headers[0])
+    assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_list_reads_use_replica(client: AsyncClient, registered_user, monkeypatch):
+    user_id = (await client.get("/user/self", headers=registered_user)).json()["id"]
+
+    response = await client.get("/categories/", headers=registered_user)
+    task_data = {
+        "name": "Replica",
+        "description": "Replica task",
+        "priority": 1,
+        "category_id": response.json()[0]["id"],
+        "date": "2025-01-01"
+    }
+    response = await client.post("/tasks/", json=task_data, headers=registered_user)
+    assert response.status_code == 200
+    task = response.json()
+
+    # The primary itself stands in for the replica, only the engine tells them apart
+    replica = create_async_engine(engine.url, connect_args=connect_args)
+    monkeypatch.setattr(database, "replica_session", async_sessionmaker(replica, expire_on_commit=False))
+    try:
+        with capture_statements(replica) as statements:
+            response = await client.get("/tasks/", headers=registered_user)
+            assert response.status_code == 200
+            assert [item["id"] for item in response.json()] == [task["id"]]
+            assert any("FROM tasks" in statement for statement in statements)
+
+            response = await client.get(f'/tasks/{task["id"]}', headers=registered_user)
+            assert response.status_code == 200
+            assert sum("FROM tasks" in statement for statement in statements) == 1
+
+            # After a write the unit of work reads its own writes from the primary
+            statements.clear()
+            async with session_scope():
+                changed = await TaskRepository().change_task_status(task["id"], user_id)
+                tasks = await TaskRepository().get_user_tasks_page(user_id, TaskFilters(), None, 10)
+            assert [item.completed for item in tasks] == [changed.completed]
+            assert not statements
+    finally:
+        await replica.dispose()
+
+
+@pytest.mark.asyncio
+async def test_tasks_pagination(client: AsyncClient, registered_user):
+    response = await client.get("/categories/", headers=registered_user)
+    base_category_id = response.json()[0]["id"]
+    response = await client.post("/categories/", json={"name": "Page", "color": "#000000"}, headers=registered_user)
+    category_id = response.json()["id"]
+
+    tasks = []
+    for i in range(7):
+        task_data = {
+            "name": f"Page{i}",
+            "description": "Page task",
+            "priority": i % 3 + 1,
+            "category_id": category_id if i % 2 else base_category_id,
+            # Several tasks share a date, so the id has to break ties
+            "date": f"2025-01-0{i // 3 + 1}"
+        }
+        response = await client.post("/tasks/", json=task_data, headers=registered_user)
+        assert response.status_code == 200
+        tasks.append(response.json())
+    tasks.sort(key=lambda task: (task["date"], task["id"]))
+
+    pages = []
+    response = await client.get("/tasks/", params={"limit": 3}, headers=registered_user)
+    while True:
+        assert response.status_code == 200
+        pages.append(response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 3, "cursor": response.headers["X-Next-Cursor"]}
+        response = await client.get("/tasks/", params=params, headers=registered_user)
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [task for page in pages for task in page] == tasks
+
+    params = {"category_id": category_id, "date_from": "2025-01-02", "priority": 3}
+    response = await client.get("/tasks/", params=params, headers=registered_user)
+    assert response.json() == [task for task in tasks if task["name"] == "Page5"]
+    await client.put(f'/tasks/{tasks[0]["id"]}/change_status', headers=registered_user)
+    response = await client.get("/tasks/", params={"completed": True, "date_to": "2025-01-01"}, headers=registered_user)
+    assert [task["id"] for task in response.json()] == [tasks[0]["id"]]
+
+    response = await client.get("/tasks/", params={"limit": 3, "fields": "name,priority"}, headers=registered_user)
+    assert response.json() == [{"name": task["name"], "priority": task["priority"]} for task in tasks[:3]]
+    next_page = await client.get(
+        "/tasks/",
+        params={"limit": 3, "fields": "id", "cursor": response.headers["X-Next-Cursor"]},
+        headers=registered_user
+    )
+    assert next_page.json() == [{"id": task["id"]} for task in tasks[3:6]]
+
+    response = await client.get("/tasks/", params={"cursor": "not a cursor"}, headers=registered_user)
+    assert response.status_code == 400
+    response = await client.get("/tasks/", params={"limit": 10 ** 6}, headers=registered_user)
+    assert response.status_code == 422
+
+    # Without a limit the listing is paged by the default page size, never unbounded
+    extra_tasks = [
+        {"name": f"Bulk{i}", "description": "", "priority": 1, "category_id": category_id, "date": "2025-02-01"}
+        for i in range(config.pagination.DEFAULT_PAGE_SIZE)
+    ]
+    response = await client.post("/tasks/batch", json={"tasks": extra_tasks}, headers=registered_user)
+    assert response.status_code == 200
+    response = await client.get("/tasks/", params={"fields": "id"}, headers=registered_user)
+    assert len(response.json()) == config.pagination.DEFAULT_PAGE_SIZE
+    next_page = await client.get("/tasks/", params={"fields": "id", "cursor": response.headers["X-Next-Cursor"]},
+                                 headers=registered_user)
+    assert len(next_page.json()) == len(tasks)
+    assert "X-Next-Cursor" not in next_page.headers
+
+
+@pytest.mark.asyncio
+async def test_batch_tasks(client: AsyncClient, register_user, captured_statements):
+    headers = [await register_user() for _ in range(2)]
+
+    category_id = (await client.get("/categories/", headers=headers[0])).json()[0]["id"]
+    foreign_category_id = (await client.get("/categories/", headers=headers[1])).json()[0]["id"]
+    tasks_data = [
+        {
+            "name": f"Batch{i}",
+            "description": "Batch task",
+            "priority": 2,
+            "category_id": foreign_category_id if i == 1 else category_id,
+            "date": "2025-01-01"
+        }
+        for i in range(4)
+    ]
+
+    captured_statements.clear()
+    response = await client.post("/tasks/batch", json={"tasks": tasks_data}, headers=headers[0])
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["success"] for result in results] == [True, False, True, True]
+    assert results[1]["detail"] == "Category not found"
+    assert [result["task"]["name"] for result in results if result["success"]] == ["Batch0", "Batch2", "Batch3"]
+    assert sum(statement.startswith("INSERT INTO tasks") for statement in captured_statements) == 1
+
+    ids = [result["id"] for result in results if result["success"]]
+    response = await client.get("/tasks/", headers=headers[0])
+    assert sorted(task["id"] for task in response.json()) == sorted(ids)
+
+    response = await client.patch(
+        "/tasks/batch/status", json={"ids": [ids[0], -1, ids[1]], "completed": True}, headers=headers[1]
+    )
+    assert [result["success"] for result in response.json()] == [False, False, False]
+    response = await client.patch(
+        "/tasks/batch/status", json={"ids": [ids[0], -1, ids[1]], "completed": True}, headers=headers[0]
+    )
+    assert response.status_code == 200
+    results = response.json()
+    assert [result["success"] for result in results] == [True, False, True]
+    assert results[1] == {"id": -1, "success": False, "detail": "Task not found", "task": None}
+    assert results[0]["task"]["completed"] and results[2]["task"]["completed"]
+
+    response = await client.request("DELETE", "/tasks/batch", json={"ids": ids[:2]}, headers=headers[1])
+    assert [result["success"] for result in response.json()] == [False, False]
+    response = await client.request("DELETE", "/tasks/batch", json={"ids": ids[:2] + [-1]}, headers=headers[0])
+    assert [result["success"] for result in response.json()] == [True, True, False]
+    response = await client.get("/tasks/", headers=headers[0])
+    assert [task["id"] for task in response.json()] == ids[2:]
+
+    response = await client.post("/tasks/batch", json={"tasks": []}, headers=headers[0])
+    assert response.status_code == 422
+
+
+@pytest.mark.asyncio
+async def test_conditional_get(client: AsyncClient, registered_user, captured_statements):
+    response = await client.get("/tasks/", headers=registered_user)
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    response = await client.get("/categories/", headers=registered_user)
+    categories_etag = response.headers["ETag"]
+    assert categories_etag != etag
+    category_id = response.json()[0]["id"]
+
+    captured_statements.clear()
+    for path, path_etag in (("/tasks/", etag), ("/categories/", categories_etag)):
+        response = await client.get(path, headers={**registered_user, "If-None-Match": f'"other", {path_etag}'})
+        assert response.status_code == 304
+        assert response.headers["ETag"] == path_etag
+        assert not response.content
+    assert not any("FROM tasks" in statement or "FROM categories" in statement for statement in captured_statements)
+
+    # Another path or query is another representation, the tag doesn't validate it
+    for path, params in (("/categories/", {}), ("/tasks/", {"limit": 1}), ("/tasks/", {"fields": "id"})):
+        response = await client.get(path, params=params, headers={**registered_user, "If-None-Match": etag})
+        assert response.status_code == 200
+        assert response.headers["ETag"] != etag
+
+    # Every write moves the version on
+    task_data = {
+        "name": "Etag",
+        "description": "Etag task",
+        "priority": 1,
+        "category_id": category_id,
+        "date": "2025-01-01"
+    }
+    response = await client.post("/tasks/", json=task_data, headers=registered_user)
+    task = response.json()
+    etags = {etag}
+    for method, path, body in (
+            ("GET", "/tasks/", None),
+            ("PUT", f'/tasks/{task["id"]}/change_status', None),
+            ("POST", "/categories/", {"name": "Etag", "color": "#000000"}),
+            ("DELETE", f'/tasks/{task["id"]}', None),
+    ):
+        if method != "GET":
+            response = await client.request(method, path, json=body, headers=registered_user)
+            assert response.status_code == 200
+        response = await client.get("/tasks/", headers={**registered_user, "If-None-Match": etag})
+        assert response.status_code == 200
+        etag = response.headers["ETag"]
+        assert etag not in etags
+        etags.add(etag)
+
+    # A failed write leaves the version as it was
+    response = await client.put(f'/tasks/{task["id"]}/change_status', headers=registered_user)
+    assert response.status_code == 404
+    response = await client.get("/tasks/", headers={**registered_user, "If-None-Match": etag})
+    assert response.status_code == 304
+
+
+@pytest.mark.asyncio
+async def test_task_stats(client: AsyncClient, registered_user, captured_statements):
+    response = await client.post("/categories/", json={"name": "Stats", "color": "#000000"}, headers=registered_user)
+    category_id = response.json()["id"]
+    response = await client.get("/categories/", headers=registered_user)
+    base_category_id = next(category["id"] for category in response.json() if category["id"] != category_id)
+
+    today = datetime.date.today()
+    tasks = []
+    for priority, category, date in (
+            (1, category_id, today - datetime.timedelta(days=1)),
+            (1, category_id, today),
+            (3, base_category_id, today),
+            (3, base_category_id, today + datetime.timedelta(days=1)),
+    ):
+        task_data = {
+            "name": "Stats",
+            "description": "Stats task",
+            "priority": priority,
+            "category_id": category,
+            "date": date.isoformat()
+        }
+        response = await client.post("/tasks/", json=task_data, headers=registered_user)
+        tasks.append(response.json())
+    response = await client.put(f'/tasks/{tasks[2]["id"]}/change_status', headers=registered_user)
+    assert response.status_code == 200
+
+    captured_statements.clear()
+    response = await client.get("/tasks/stats", headers=registered_user)
+    assert response.status_code == 200
+    stats = response.json()
+    assert len([statement for statement in captured_statements if "FROM tasks" in statement]) == 1
+
+    # Served from the cache until the next write
+    captured_statements.clear()
+    response = await client.get("/tasks/stats", headers=registered_user)
+    assert response.json() == stats
+    assert not any("FROM tasks" in statement for statement in captured_statements)
+
+    assert stats == {
+        "total": 4,
+        "completed": 1,
+        "uncompleted": 3,
+        "overdue": 1,
+        "due_today": 1,
+        "by_priority": [{"priority": 1, "count": 2}, {"priority": 2, "count": 0}, {"priority": 3, "count": 2}],
+        "by_category": sorted(
+            [{"category_id": category_id, "count": 2}, {"category_id": base_category_id, "count": 2}],
+            key=lambda item: item["category_id"]
+        ),
+    }
+
+    response = await client.delete(f'/tasks/{tasks[0]["id"]}', headers=registered_user)
+    assert response.status_code == 200
+    response = await client.get("/tasks/stats", headers=registered_user)
+    stats = response.json()
+    assert (stats["total"], stats["overdue"], stats["due_today"]) == (3, 0, 1)
+
+
+@pytest.mark.asyncio
+async def test_search_tasks(client: AsyncClient, register_user):
+    headers, other_headers = [await register_user() for _ in range(2)]
+
+    task_ids = {}
+    for user_headers, name, description in (
+            (headers, "Write report", "Compare milk prices"),
+            (headers, "Buy milk", "Skimmed milk from the store"),
+            (headers, "Call mom", ""),
+            (headers, "Milk", "Before breakfast"),
+            (other_headers, "Sell milk", ""),
+    ):
+        response = await client.get("/categories/", headers=user_headers)
+        task_data = {
+            "name": name,
+            "description": description,
+            "priority": 2,
+            "category_id": response.json()[0]["id"],
+            "date": "2025-01-01"
+        }
+        response = await client.post("/tasks/", json=task_data, headers=user_headers)
+        assert response.status_code == 200
+        task_ids[name] = response.json()["id"]
+
+    # Matches in the name rank first, other users' tasks never show up
+    found, cursor = [], None
+    while True:
+        params = {"q": "milk", "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = await client.get("/tasks/search", params=params, headers=headers)
+        assert response.status_code == 200
+        assert len(response.json()) <= 2
+        found.extend(task["name"] for task in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert found[-1] == "Write report"
+    assert sorted(found[:-1]) == ["Buy milk", "Milk"]
+
+    response = await client.get("/tasks/search", params={"q": '"buy milk" or mom'}, headers=headers)
+    assert sorted(task["name"] for task in response.json()) == ["Buy milk", "Call mom"]
+    response = await client.get("/tasks/search", params={"q": "milk -prices -skimmed"}, headers=headers)
+    assert [task["name"] for task in response.json()] == ["Milk"]
+
+    response = await client.put(f'/tasks/{task_ids["Call mom"]}', headers=headers, json={
+        "name": "Call dad",
+        "description": "",
+        "priority": 2,
+        "category_id": response.json()[0]["category_id"],
+        "date": "2025-01-01"
+    })
+    response = await client.get("/tasks/search", params={"q": "mom"}, headers=headers)
+    assert response.json() == []
+
+    # Each query has a tag of its own
+    response = await client.get("/tasks/search", params={"q": "milk"}, headers=headers)
+    etag = response.headers["ETag"]
+    response = await client.get("/tasks/search", params={"q": "milk"}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 304
+    response = await client.get("/tasks/search", params={"q": "report"}, headers={**headers, "If-None-Match": etag})
+    assert response.status_code == 200
+    assert [task["name"] for task in response.json()] == ["Write report"]
+
+    response = await client.get("/tasks/search", params={"q": "milk", "cursor": "invalid"}, headers=headers)
+    assert response.status_code == 400
+    response = await client.get("/tasks/search", headers=headers)
+    assert response.status_code == 422
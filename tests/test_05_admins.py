@@ -1,9 +1,11 @@
 import pytest
 from httpx import AsyncClient
+from sqlalchemy import text
 
 from tests.conftest import create_user_helper, TEST_DATA, TEST_ADMIN_DATA, create_admin_and_base_users_helper, \
     get_all_users_helper
 from src.users.repositories import UserRepository
+from src.database import async_session, database_config
 
 
 @pytest.mark.asyncio
@@ -222,3 +224,59 @@ async def test_delete_user_by_id(client: AsyncClient, get_test_users_data):
         headers={"Authorization": f"Bearer {admin_access_token}"}
     )
     assert response.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_get_pool_stats(client: AsyncClient, get_test_users_data):
+    response = await client.get("/admin/db/pool")
+    assert response.status_code == 403
+
+    await create_admin_and_base_users_helper(client)
+    admin_access_token = TEST_ADMIN_DATA["admin"]["access_token"]
+
+    response = await client.get("/admin/db/pool", headers={"Authorization": f"Bearer {admin_access_token}"})
+    assert response.status_code == 200
+
+    stats = response.json()
+    assert stats["size"] == database_config.POOL_SIZE
+    assert stats["max_overflow"] == database_config.MAX_OVERFLOW
+    assert 0 <= stats["overflow"] <= stats["max_overflow"]
+    assert stats["checked_in"] + stats["checked_out"] <= stats["size"] + stats["overflow"]
+
+    if database_config.POOLER_MODE == "none":
+        # Behind a transaction pooler the server connection isn't ours to name
+        async with async_session() as session:
+            result = await session.execute(text("SELECT current_setting('application_name')"))
+            assert result.scalar() == database_config.APPLICATION_NAME
+
+
+@pytest.mark.asyncio
+async def test_users_sparse_fieldsets(client: AsyncClient, captured_statements):
+    await create_admin_and_base_users_helper(client)
+    headers = {"Authorization": f'Bearer {TEST_ADMIN_DATA["admin"]["access_token"]}'}
+    response = await client.get("/admin/users", headers=headers)
+    assert response.status_code == 200
+    users = response.json()
+
+    captured_statements.clear()
+    response = await client.get("/admin/users", params={"fields": "id,email", "include": ""}, headers=headers)
+    assert response.status_code == 200
+    assert response.json() == [{"id": user["id"], "email": user["email"]} for user in users]
+    select_users = [statement for statement in captured_statements if "FROM users" in statement][-1]
+    assert "password_hash" not in select_users and "users.surname" not in select_users
+    assert not any("FROM tasks" in statement or "FROM categories" in statement for statement in captured_statements)
+
+    response = await client.get("/admin/users", params={"fields": "id", "include": "categories"}, headers=headers)
+    assert response.json() == [
+        {
+            "id": user["id"],
+            "categories": [
+                {key: value for key, value in category.items() if key != "tasks"} for category in user["categories"]
+            ]
+        }
+        for user in users
+    ]
+    response = await client.get("/admin/users", params={"fields": "", "include": "categories.tasks"}, headers=headers)
+    assert response.json() == [{"categories": user["categories"]} for user in users]
+    response = await client.get("/admin/users", params={"fields": "password_hash"}, headers=headers)
+    assert response.status_code == 400
@@ -0,0 +1,54 @@
+import asyncio
+
+import pytest
+from httpx import AsyncClient
+
+from src.id_generator import FeistelPermutation, IdGenerator, global_vars
+from src.categories.repositories import CategoryRepository
+from src.tasks.models import task_id_sequence
+
+
+def test_feistel_permutation():
+    for domain_size in (1, 2, 7, 1000, 4099):
+        permutation = FeistelPermutation(domain_size, key=42)
+        assert sorted(permutation.permute(i) for i in range(domain_size)) == list(range(domain_size))
+
+    permutation = FeistelPermutation(global_vars.MAX_ID - global_vars.MIN_ID + 1, key=42)
+    values = [permutation.permute(i) for i in range(100)]
+    assert values != sorted(values)
+    with pytest.raises(ValueError):
+        permutation.permute(permutation.domain_size)
+
+
+@pytest.mark.asyncio
+async def test_id_generator_concurrency():
+    # Several generators share one sequence, like several app processes do
+    generators = [
+        IdGenerator(task_id_sequence, global_vars.MIN_ID, global_vars.MAX_ID, key=global_vars.ID_KEY, block_size=7)
+        for _ in range(4)
+    ]
+    ids = await asyncio.gather(*(generators[i % len(generators)].next_id() for i in range(2000)))
+
+    assert len(set(ids)) == len(ids)
+    assert all(global_vars.MIN_ID <= unique_id <= global_vars.MAX_ID for unique_id in ids)
+    assert all(len(str(unique_id)) == len(str(global_vars.MIN_ID)) for unique_id in ids)
+
+
+@pytest.mark.asyncio
+async def test_create_skips_taken_id(client: AsyncClient, registered_user, monkeypatch):
+    response = await client.post("/categories/", json={"name": "Taken", "color": "#000000"}, headers=registered_user)
+    assert response.status_code == 200
+    taken_id = response.json()["id"]
+
+    # A row created before the generator may already hold the next generated id
+    generate_id = CategoryRepository.generate_id
+    ids = iter([taken_id])
+
+    async def generate_taken_id_first(self) -> int:
+        return next(ids, None) or await generate_id(self)
+
+    monkeypatch.setattr(CategoryRepository, "generate_id", generate_taken_id_first)
+    response = await client.post("/categories/", json={"name": "Free", "color": "#000000"}, headers=registered_user)
+    assert response.status_code == 200
+    assert response.json()["id"] != taken_id
+    assert response.json()["name"] == "Free"
@@ -0,0 +1,39 @@
+import pytest
+from sqlalchemy import func, literal_column, select, text
+
+from src.database import async_session, engine
+from src.categories.models import Category
+from src.sync.models import Tombstone
+from src.tasks.models import Task
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("query, indexes", [
+    # Any index on (user_id, ...) serves lookups by user_id alone
+    (select(Task).where(Task.user_id == 1), ("ix_tasks_user_id_date", "ix_tasks_user_id_change_id")),
+    (select(Task).where(Task.user_id == 1).order_by(Task.date), ("ix_tasks_user_id_date",)),
+    (select(Task).where(Task.category_id == 1), ("ix_tasks_category_id",)),
+    # Task statistics aggregate over one user's tasks
+    (select(Task.completed, Task.priority, Task.category_id, func.count()).where(Task.user_id == 1).group_by(
+        Task.completed, Task.priority, Task.category_id
+    ), ("ix_tasks_user_id_date", "ix_tasks_user_id_change_id")),
+    (select(Category).where(Category.user_id == 1), ("ix_categories_user_id", "ix_categories_user_id_change_id")),
+    # Searches combine it with the user_id index once a user has enough tasks to make it worth it
+    (select(Task).where(Task.search_vector.bool_op("@@")(
+        func.websearch_to_tsquery(literal_column("'simple'::regconfig"), "milk")
+    )), ("ix_tasks_search_vector",)),
+    (select(Task).where(Task.user_id == 1, Task.change_id >= 1), ("ix_tasks_user_id_change_id",)),
+    (select(Category).where(Category.user_id == 1, Category.change_id >= 1), ("ix_categories_user_id_change_id",)),
+    (select(Tombstone).where(Tombstone.user_id == 1, Tombstone.change_id >= 1), ("ix_tombstones_user_id_change_id",)),
+])
+async def test_hot_queries_use_indexes(query, indexes):
+    sql = str(query.compile(engine.sync_engine, compile_kwargs={"literal_binds": True}))
+    async with async_session() as session:
+        # The test tables are tiny, so make the planner pick an index whenever one applies,
+        await session.execute(text("SET LOCAL enable_seqscan = off"))
+        # and one that returns the rows in order whenever the query sorts them
+        await session.execute(text("SET LOCAL enable_sort = off"))
+        result = await session.execute(text(f"EXPLAIN {sql}"))
+        plan = "\n".join(result.scalars().all())
+
+    assert any(index in plan for index in indexes), plan
@@ -0,0 +1,107 @@
+import asyncio
+import os
+import sys
+from pathlib import Path
+
+import asyncpg
+import pytest
+
+from tests.conftest import config, TEST_OUTCOMES
+from tests.pgbouncer_stand_in import TransactionPoolerStandIn
+
+
+def create_pooler() -> TransactionPoolerStandIn:
+    database = config.database
+    return TransactionPoolerStandIn(
+        host=database.DB_HOST,
+        port=int(database.DB_PORT),
+        user=database.DB_USER,
+        password=database.DB_PASS,
+        database=database.DB_NAME
+    )
+
+
+@pytest.mark.asyncio
+async def test_pooler_stand_in():
+    pooler = create_pooler()
+    await pooler.start()
+    connect = {"host": "127.0.0.1", "port": pooler.port, "user": config.database.DB_USER,
+               "password": config.database.DB_PASS, "database": config.database.DB_NAME}
+    try:
+        # Like PgBouncer it breaks cached prepared statements and rejects session settings
+        connection = await asyncpg.connect(**connect)
+        with pytest.raises(asyncpg.InvalidSQLStatementNameError):
+            for i in range(pooler.pool_size):
+                await connection.fetchval("SELECT $1::int", i)
+        await connection.close()
+
+        with pytest.raises(asyncpg.PostgresError):
+            await asyncpg.connect(**connect, server_settings={"statement_timeout": "1000"})
+        assert pooler.rejected_parameters == ["statement_timeout"]
+    finally:
+        await pooler.stop()
+
+
+@pytest.mark.asyncio
+async def test_migrations_without_statement_timeout():
+    # A timeout that aborts any real statement, migrations must run regardless
+    env = {**os.environ, "DB_STATEMENT_TIMEOUT": "1"}
+    script = (
+        "import asyncio\n"
+        "import asyncpg\n"
+        "from src.database import migration_connect_args, database_config\n"
+        "async def main():\n"
+        "    connection = await asyncpg.connect(database_config.DATABASE_URL.replace('+asyncpg', ''),\n"
+        "                                       **migration_connect_args)\n"
+        "    print(await connection.fetchval('SHOW statement_timeout'))\n"
+        "    await connection.close()\n"
+        "asyncio.run(main())\n"
+    )
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", script,
+        cwd=Path(__file__).parent.parent,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT,
+        env=env,
+    )
+    output, _ = await process.communicate()
+    assert output.decode().strip().splitlines()[-1] == "0", output.decode()
+
+
+@pytest.mark.asyncio
+async def test_suite_through_transaction_pooler():
+    this_file = Path(__file__)
+    passed_directly = {
+        node_id for node_id, outcome in TEST_OUTCOMES.items() if outcome == "passed" and this_file.name not in node_id
+    }
+    if not passed_directly:
+        pytest.skip("compares with the results of the rest of the suite, run it together with them")
+
+    pooler = create_pooler()
+    await pooler.start()
+    env = {
+        **os.environ,
+        "DB_HOST": "127.0.0.1",
+        "DB_PORT": str(pooler.port),
+        "DB_POOLER_MODE": "transaction",
+        "DB_STATEMENT_TIMEOUT": "60000",
+    }
+    try:
+        process = await asyncio.create_subprocess_exec(
+            sys.executable, "-m", "pytest", "-q", "-rA", "-p", "no:cacheprovider",
+            "--ignore", f"tests/{this_file.name}", "tests",
+            cwd=this_file.parent.parent,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.STDOUT,
+            env=env,
+        )
+        output, _ = await process.communicate()
+    finally:
+        await pooler.stop()
+
+    lines = output.decode().splitlines()
+    passed_through_pooler = {line.split(" ", 1)[1] for line in lines if line.startswith("PASSED ")}
+    assert pooler.rejected_parameters == []
+    assert pooler.transactions > 0
+    # Everything that passes on a direct connection passes through the pooler as well
+    assert passed_directly <= passed_through_pooler, "\n".join(lines[-50:])
@@ -0,0 +1,74 @@
+import pytest
+from httpx import AsyncClient
+from sqlalchemy import update
+
+from src.database import async_session
+from src.tasks.models import Task
+
+
+def ids(items: list) -> set:
+    return {item["id"] for item in items}
+
+
+@pytest.mark.asyncio
+async def test_sync(client: AsyncClient, registered_user):
+    response = await client.get("/sync", headers=registered_user)
+    assert response.status_code == 200
+    changes = response.json()
+    assert changes["tasks"] == [] and changes["deleted"] == []
+    assert len(changes["categories"]) == 1
+    base_category_id = changes["categories"][0]["id"]
+
+    response = await client.post("/categories/", json={"name": "Sync", "color": "#000000"}, headers=registered_user)
+    category_id = response.json()["id"]
+    tasks = []
+    for i, task_category_id in enumerate((base_category_id, base_category_id, category_id)):
+        task_data = {
+            "name": f"Sync{i}",
+            "description": "Sync task",
+            "priority": 1,
+            "category_id": task_category_id,
+            "date": "2025-01-01"
+        }
+        response = await client.post("/tasks/", json=task_data, headers=registered_user)
+        tasks.append(response.json())
+
+    response = await client.get("/sync", params={"since": changes["cursor"]}, headers=registered_user)
+    changes = response.json()
+    assert ids(changes["tasks"]) == ids(tasks)
+    assert ids(changes["categories"]) == {category_id}
+    assert changes["deleted"] == []
+
+    # Edits, deletes and the tasks a category delete moves all show up
+    response = await client.put(f'/tasks/{tasks[0]["id"]}/change_status', headers=registered_user)
+    assert response.status_code == 200
+    response = await client.delete(f'/tasks/{tasks[1]["id"]}', headers=registered_user)
+    assert response.status_code == 200
+    response = await client.delete(f'/categories/{category_id}', headers=registered_user)
+    assert response.status_code == 200
+
+    response = await client.get("/sync", params={"since": changes["cursor"]}, headers=registered_user)
+    changes = response.json()
+    assert ids(changes["tasks"]) == {tasks[0]["id"], tasks[2]["id"]}
+    assert {task["id"]: task["category_id"] for task in changes["tasks"]}[tasks[2]["id"]] == base_category_id
+    assert changes["categories"] == []
+    assert {(item["entity"], item["id"]) for item in changes["deleted"]} == {
+        ("tasks", tasks[1]["id"]), ("categories", category_id)
+    }
+
+    response = await client.get("/sync", params={"since": changes["cursor"]}, headers=registered_user)
+    assert response.json()["tasks"] == [] and response.json()["deleted"] == []
+
+    # A write that commits after a sync shows up in the next one, even though it started before
+    async with async_session() as session:
+        await session.execute(update(Task).where(Task.id == tasks[0]["id"]).values(name="Late"))
+        response = await client.get("/sync", params={"since": changes["cursor"]}, headers=registered_user)
+        changes = response.json()
+        assert changes["tasks"] == []
+        await session.commit()
+
+    response = await client.get("/sync", params={"since": changes["cursor"]}, headers=registered_user)
+    assert [task["name"] for task in response.json()["tasks"]] == ["Late"]
+
+    response = await client.get("/sync", params={"since": "not a cursor"}, headers=registered_user)
+    assert response.status_code == 400
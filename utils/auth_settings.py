@@ -1,16 +1,77 @@
+import asyncio
 import datetime
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Tuple
+
 import bcrypt
 import jwt
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 
 from config_data.config import Config, load_config
+from utils.cache import TTLCache
 
 settings: Config = load_config(".env")
 auth_config = settings.authJWT
+hashing_config = settings.password_hashing
+
+verified_tokens_cache = TTLCache(maxsize=auth_config.verified_tokens_cache_size, ttl=0)
+
+# bcrypt releases the GIL, so a small thread pool keeps it off the event loop
+password_executor = ThreadPoolExecutor(max_workers=hashing_config.WORKERS, thread_name_prefix="bcrypt")
+_password_jobs = 0
+
+
+AsymmetricKey = rsa.RSAPrivateKey | rsa.RSAPublicKey | ec.EllipticCurvePrivateKey | ec.EllipticCurvePublicKey | \
+                ed25519.Ed25519PrivateKey | ed25519.Ed25519PublicKey
+
+
+class PasswordHashingBusyError(Exception):
+    pass
+
+
+def _key_algorithm(key: AsymmetricKey) -> str:
+    if isinstance(key, (rsa.RSAPrivateKey, rsa.RSAPublicKey)):
+        return "RS256"
+    if isinstance(key, (ec.EllipticCurvePrivateKey, ec.EllipticCurvePublicKey)) and key.curve.name == "secp256r1":
+        return "ES256"
+    if isinstance(key, (ed25519.Ed25519PrivateKey, ed25519.Ed25519PublicKey)):
+        return "EdDSA"
+    raise ValueError(f"Unsupported JWT key type {type(key).__name__!r}")
+
+
+def _key_id(public_key: AsymmetricKey) -> str:
+    der = public_key.public_bytes(serialization.Encoding.DER, serialization.PublicFormat.SubjectPublicKeyInfo)
+    return hashlib.sha256(der).hexdigest()[:16]
+
+
+def load_private_key(path: Path) -> AsymmetricKey:
+    return serialization.load_pem_private_key(path.read_bytes(), password=None)
+
+
+def load_public_key(path: Path) -> AsymmetricKey:
+    return serialization.load_pem_public_key(path.read_bytes())
+
+
+# Keys are parsed once, PyJWT uses key objects as is
+signing_key = load_private_key(auth_config.private_key_path)
+if _key_algorithm(signing_key) != auth_config.algorithm:
+    raise ValueError(f"JWT private key does not match algorithm {auth_config.algorithm!r}")
+signing_key_id = _key_id(signing_key.public_key())
+
+# Current key first, then keys still accepted during a rotation window
+verification_keys: Dict[str, Tuple[AsymmetricKey, str]] = {}
+for _public_key in [load_public_key(auth_config.public_key_path)] + \
+                   [load_public_key(path) for path in auth_config.previous_public_key_paths]:
+    verification_keys[_key_id(_public_key)] = (_public_key, _key_algorithm(_public_key))
 
 
 def encode_jwt(
         payload: dict,
-        private_key: str = auth_config.private_key_path.read_text(),
+        private_key: AsymmetricKey = signing_key,
         algorithm: str = auth_config.algorithm,
         expire_minutes: int = auth_config.access_token_expire_minutes,
         expire_timedelta: datetime.timedelta | None = None
@@ -22,36 +83,88 @@ def encode_jwt(
         expire = now + datetime.timedelta(minutes=expire_minutes)
 
     to_encode = payload.copy()
-    to_encode.update(exp=expire, iat=now)
+    # Sub-second iat lets revocations tell apart tokens issued right before and after them
+    to_encode.update(exp=expire, iat=now.replace(tzinfo=datetime.timezone.utc).timestamp())
     encoded = jwt.encode(
         to_encode,
         private_key,
         algorithm=algorithm,
+        headers={"kid": signing_key_id if private_key is signing_key else _key_id(private_key.public_key())},
     )
     return encoded
 
 
+def _verify_jwt(token: str | bytes) -> Tuple[dict, str]:
+    # Returns the claims and the id of the key that verified them
+    kid = jwt.get_unverified_header(token).get("kid")
+    if kid is not None:
+        if kid not in verification_keys:
+            raise jwt.InvalidSignatureError("Unknown signing key")
+        candidates = [kid]
+    else:
+        # Tokens issued before key ids were added carry no kid
+        candidates = list(verification_keys)
+
+    for key_id in candidates:
+        public_key, algorithm = verification_keys[key_id]
+        try:
+            return jwt.decode(token, public_key, algorithms=[algorithm]), key_id
+        except (jwt.InvalidSignatureError, jwt.InvalidAlgorithmError):
+            continue
+    raise jwt.InvalidSignatureError("Signature verification failed")
+
+
 def decode_jwt(
         token: str | bytes,
-        public_key: str = auth_config.public_key_path.read_text(),
+        public_key: AsymmetricKey | str | None = None,
         algorithm: str = auth_config.algorithm,
 ) -> dict:
-    decoded = jwt.decode(
-        token,
-        public_key,
-        algorithms=[algorithm],
-    )
+    if public_key is not None:
+        return jwt.decode(
+            token,
+            public_key,
+            algorithms=[algorithm],
+        )
+
+    token_bytes = token.encode() if isinstance(token, str) else token
+    cache_key = hashlib.sha256(token_bytes).digest()
+    cached = verified_tokens_cache.get(cache_key)
+    if cached is not None:
+        key_id, claims = cached
+        # Claims are only as good as the key that verified them, a key dropped from rotation takes them along
+        if key_id in verification_keys:
+            return dict(claims)
+        verified_tokens_cache.invalidate(cache_key)
+
+    decoded, key_id = _verify_jwt(token)
+
+    # Claims stay valid only until the token itself expires
+    expire = decoded.get("exp")
+    if expire is not None:
+        ttl = expire - time.time()
+        if ttl > 0:
+            verified_tokens_cache.set(cache_key, (key_id, dict(decoded)), ttl=ttl)
+
     return decoded
 
 
 def hash_password(
         password: str,
+        rounds: int = hashing_config.ROUNDS,
 ) -> bytes:
-    salt = bcrypt.gensalt()
+    salt = bcrypt.gensalt(rounds=rounds)
     pwd_bytes: bytes = password.encode()
     return bcrypt.hashpw(pwd_bytes, salt)
 
 
+def password_needs_rehash(
+        hashed_password: bytes,
+        rounds: int = hashing_config.ROUNDS,
+) -> bool:
+    # bcrypt hashes look like b"$2b$12$<salt><hash>"
+    return int(hashed_password.split(b"$")[2]) != rounds
+
+
 def validate_password(
         password: str,
         hashed_password: bytes,
@@ -60,3 +173,29 @@ def validate_password(
         password=password.encode(),
         hashed_password=hashed_password,
     )
+
+
+async def _run_password_job(func, *args):
+    global _password_jobs
+
+    if _password_jobs >= hashing_config.WORKERS + hashing_config.QUEUE_LIMIT:
+        raise PasswordHashingBusyError()
+
+    _password_jobs += 1
+    try:
+        return await asyncio.get_running_loop().run_in_executor(password_executor, func, *args)
+    finally:
+        _password_jobs -= 1
+
+
+async def hash_password_async(
+        password: str,
+) -> bytes:
+    return await _run_password_job(hash_password, password)
+
+
+async def validate_password_async(
+        password: str,
+        hashed_password: bytes,
+) -> bool:
+    return await _run_password_job(validate_password, password, hashed_password)
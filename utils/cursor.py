@@ -0,0 +1,22 @@
+import base64
+import binascii
+import json
+from typing import Any, Dict
+
+
+# Cursors are opaque to clients: url-safe base64 of the keyset values the next page starts after
+def encode_cursor(values: Dict[str, Any]) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Dict[str, Any]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as e:
+        raise ValueError("Malformed cursor") from e
+
+    if not isinstance(values, dict):
+        raise ValueError("Malformed cursor")
+    return values
@@ -1,32 +1,135 @@
+import asyncio
+import logging
 import random
 import smtplib
 
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
+from typing import List, Optional, Set, Tuple
 
 from config_data.config import load_config, EmailSender
 
 email_sender: EmailSender = load_config(".env").email_sender
 
+logger = logging.getLogger(__name__)
 
-def _generate_code():
-    return random.randint(email_sender.MIN_CODE, email_sender.MAX_CODE)
 
+def generate_verification_code() -> int:
+    return random.randint(email_sender.MIN_CODE, email_sender.MAX_CODE)
 
-def send_verification_code(email: str) -> int:
-    smtp_server = smtplib.SMTP("smtp.gmail.com", 587)
-    smtp_server.starttls()
-    smtp_server.login(email_sender.EMAIL_NAME, email_sender.EMAIL_PASS)
 
+def _build_verification_message(email: str, code: int, sender: str) -> MIMEMultipart:
     msg = MIMEMultipart()
-    msg['From'] = email_sender.EMAIL_NAME
+    msg['From'] = sender
     msg['To'] = email
     msg['Subject'] = "Регистрация в ToDo"
 
-    code = _generate_code()
     body = f"Ваш код подтверждения: {code}\n\nЭто сообщение отправлено автоматически."
 
     msg.attach(MIMEText(body, 'plain'))
-    smtp_server.sendmail(email_sender.EMAIL_NAME, email, msg.as_string())
+    return msg
+
+
+class MailQueue:
+    def __init__(self, config: EmailSender):
+        self.config = config
+        self.sent = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.Queue[Tuple[MIMEMultipart, int]]] = None
+        self._workers: List[asyncio.Task] = []
+        self._retries: Set[asyncio.Task] = set()
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.config.QUEUE_SIZE)
+        self._workers = [asyncio.create_task(self._worker()) for _ in range(self.config.WORKERS)]
+
+    async def stop(self) -> None:
+        tasks = self._workers + list(self._retries)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._workers = []
+        self._queue = None
+
+    async def join(self) -> None:
+        await self._queue.join()
+
+    def enqueue(self, message: MIMEMultipart) -> None:
+        # Raises asyncio.QueueFull when the backlog is at its limit
+        self._queue.put_nowait((message, 0))
+
+    def _connect(self) -> smtplib.SMTP:
+        connection = smtplib.SMTP(self.config.SMTP_HOST, self.config.SMTP_PORT, timeout=30)
+        if self.config.SMTP_STARTTLS:
+            connection.starttls()
+        connection.login(self.config.EMAIL_NAME, self.config.EMAIL_PASS)
+        return connection
+
+    def _send(self, connection: Optional[smtplib.SMTP], message: MIMEMultipart) -> smtplib.SMTP:
+        if connection is not None:
+            try:
+                connection.send_message(message)
+                return connection
+            except smtplib.SMTPServerDisconnected:
+                # The server dropped an idle connection, reconnect once
+                pass
+
+        connection = self._connect()
+        connection.send_message(message)
+        return connection
+
+    @staticmethod
+    def _close(connection: Optional[smtplib.SMTP]) -> None:
+        if connection is None:
+            return
+        try:
+            connection.quit()
+        except (smtplib.SMTPException, OSError):
+            connection.close()
+
+    async def _retry(self, queue: asyncio.Queue, message: MIMEMultipart, attempt: int) -> None:
+        try:
+            await asyncio.sleep(self.config.RETRY_BACKOFF * 2 ** (attempt - 1))
+            await queue.put((message, attempt))
+        finally:
+            # The failed attempt is done only once its retry is queued, so join() waits for retries
+            queue.task_done()
+
+    async def _worker(self) -> None:
+        queue = self._queue
+        connection: Optional[smtplib.SMTP] = None
+        try:
+            while True:
+                message, attempt = await queue.get()
+                retrying = False
+                try:
+                    connection = await asyncio.to_thread(self._send, connection, message)
+                    self.sent += 1
+                except smtplib.SMTPRecipientsRefused:
+                    self.failed += 1
+                    logger.warning("Recipient refused: %s", message["To"])
+                except (smtplib.SMTPException, OSError) as e:
+                    await asyncio.to_thread(self._close, connection)
+                    connection = None
+                    if attempt < self.config.MAX_RETRIES:
+                        retrying = True
+                        retry = asyncio.create_task(self._retry(queue, message, attempt + 1))
+                        self._retries.add(retry)
+                        retry.add_done_callback(self._retries.discard)
+                    else:
+                        self.failed += 1
+                        logger.error("Failed to send email to %s: %s", message["To"], e)
+                finally:
+                    if not retrying:
+                        queue.task_done()
+        finally:
+            # Don't block the event loop on QUIT while shutting down
+            if connection is not None:
+                connection.close()
+
+
+mail_queue = MailQueue(email_sender)
+
 
-    return code
+def send_verification_code(email: str, code: int) -> None:
+    mail_queue.enqueue(_build_verification_message(email, code, email_sender.EMAIL_NAME))